@@ -0,0 +1,96 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import contextlib
+import traceback
+import urllib.request
+
+import processor
+import revocation
+
+# Bulk verification of an audit spreadsheet (CSV with serial_number,dob columns).
+# Runs locally against Firebase, or against a running server with --url.
+#
+#   python batch_verify.py audit.csv --output results.ndjson
+#   python batch_verify.py audit.csv --url https://secure-cert.onrender.com --admin-token ...
+#
+# The server endpoint requires the admin token (--admin-token or ADMIN_TOKEN).
+
+
+def read_pairs(csv_path):
+    """Read (serial, DOB) pairs from an audit CSV"""
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as file:
+        for row in csv.DictReader(file):
+            yield (row.get('serial_number') or '').strip(), (row.get('dob') or '').strip()
+
+
+def verify_remote(url, csv_path, mode, admin_token):
+    """Upload the CSV to /verify/batch and yield streamed results"""
+    pairs = [{'serialNumber': serial, 'dob': dob} for serial, dob in read_pairs(csv_path)]
+    body = json.dumps({'certificates': pairs, 'mode': mode}).encode('utf-8')
+    req = urllib.request.Request(
+        url.rstrip('/') + '/verify/batch',
+        data=body,
+        headers={'Content-Type': 'application/json', 'X-Admin-Token': admin_token or ''},
+    )
+    with urllib.request.urlopen(req) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+
+def verify_local(csv_path, mode, workers):
+    """Check the CSV directly against Firebase Storage"""
+    if not processor.initialize_firebase():
+        raise RuntimeError("Firebase initialization failed")
+    if revocation.reload_revocations() is None:
+        raise RuntimeError("Could not load the revocation list")
+    yield from processor.verify_certificates_batch(read_pairs(csv_path), mode=mode, workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk certificate verification")
+    parser.add_argument('csv_path', help="CSV with serial_number,dob columns")
+    parser.add_argument('--url', help="Server base URL; verify locally when omitted")
+    parser.add_argument('--admin-token', default=os.getenv('ADMIN_TOKEN'),
+                        help="Admin token for --url (default: ADMIN_TOKEN env)")
+    parser.add_argument('--mode', default='integrity', choices=['exists', 'integrity', 'decrypt'])
+    parser.add_argument('--workers', type=int, default=None, help="Concurrent storage fetches (local mode)")
+    parser.add_argument('--output', help="NDJSON output file (default: stdout)")
+    args = parser.parse_args()
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    counts = {}
+    started = time.time()
+    try:
+        if args.url:
+            results = verify_remote(args.url, args.csv_path, args.mode, args.admin_token)
+        else:
+            results = verify_local(args.csv_path, args.mode, args.workers)
+
+        # Keep processor logging off stdout so NDJSON output stays clean
+        with contextlib.redirect_stdout(sys.stderr):
+            for result in results:
+                out.write(json.dumps(result) + '\n')
+                counts[result.get('status')] = counts.get(result.get('status'), 0) + 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.time() - started
+    total = sum(counts.values())
+    print(f"Checked {total} certificates in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s)", file=sys.stderr)
+    for status, count in sorted(counts.items()):
+        print(f"  {status}: {count}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,197 @@
+import os
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+
+# Shared executor for Fernet decryption, used by verify_certificate and
+# batch tooling so decrypt work is spread across cores instead of running
+# inline in the request thread.
+#
+# Configuration (environment variables, read when the pool is first used):
+#   DECRYPT_EXECUTOR       'thread' (default), 'process' or 'inline'
+#   DECRYPT_WORKERS        number of workers (default: CPU count)
+#   DECRYPT_MAX_PENDING    max queued + running jobs before callers wait (default: 4 x workers)
+#   DECRYPT_QUEUE_TIMEOUT  seconds a caller waits for a free slot before giving up (default: 5)
+
+_executor = None
+_executor_kind = None
+_executor_lock = threading.Lock()
+_slots = None
+_max_pending = 0
+_queue_timeout = 5.0
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'submitted': 0,
+    'completed': 0,
+    'failed': 0,
+    'rejected': 0,
+    'in_flight': 0,
+    'max_in_flight': 0,
+    'decrypt_seconds': 0.0,
+    'bytes_decrypted': 0,
+}
+
+
+def load_fernet(key_data):
+    """Build a cipher from a stored key object
+
+    Key objects normally hold one key. During key rotation they hold the new
+    key first and the old one after it, one per line, so tokens under either
+    key still decrypt.
+    """
+    keys = [line.strip() for line in key_data.splitlines() if line.strip()]
+    if len(keys) == 1:
+        return Fernet(keys[0])
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def _decrypt_worker(encrypted_data, key):
+    """Decrypt one payload; top-level so it can run in a process pool"""
+    started = time.perf_counter()
+    try:
+        data = load_fernet(key).decrypt(encrypted_data)
+    except InvalidToken:
+        data = None
+    return data, time.perf_counter() - started
+
+
+def _get_executor():
+    """Create the executor on first use from environment configuration"""
+    global _executor, _executor_kind, _slots, _max_pending, _queue_timeout
+
+    if _executor_kind is not None:
+        return _executor
+
+    with _executor_lock:
+        if _executor_kind is not None:
+            return _executor
+
+        kind = os.getenv('DECRYPT_EXECUTOR', 'thread').strip().lower()
+        workers = int(os.getenv('DECRYPT_WORKERS', '0')) or (os.cpu_count() or 1)
+        _max_pending = int(os.getenv('DECRYPT_MAX_PENDING', '0')) or workers * 4
+        _queue_timeout = float(os.getenv('DECRYPT_QUEUE_TIMEOUT', '5'))
+        _slots = threading.BoundedSemaphore(_max_pending)
+
+        if kind == 'process':
+            _executor = ProcessPoolExecutor(max_workers=workers)
+        elif kind == 'inline':
+            _executor = None
+        else:
+            kind = 'thread'
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='decrypt')
+
+        print(f"Decrypt executor: {kind} ({workers} workers, max pending {_max_pending})")
+        _executor_kind = kind
+        return _executor
+
+
+def _record_done(elapsed, size, ok):
+    with _metrics_lock:
+        _metrics['in_flight'] -= 1
+        if ok:
+            _metrics['completed'] += 1
+            _metrics['decrypt_seconds'] += elapsed
+            _metrics['bytes_decrypted'] += size
+        else:
+            _metrics['failed'] += 1
+
+
+def is_saturated():
+    """Return True when every decrypt slot is taken and new work would have to wait"""
+    _get_executor()
+    with _metrics_lock:
+        return _metrics['in_flight'] >= _max_pending
+
+
+def decrypt(encrypted_data, key, timeout=None):
+    """Decrypt data on the shared executor and return the plaintext or None
+
+    Blocks for up to DECRYPT_QUEUE_TIMEOUT seconds for a free slot when the
+    pool is saturated, then rejects the job.
+    """
+    executor = _get_executor()
+
+    if not _slots.acquire(timeout=_queue_timeout):
+        with _metrics_lock:
+            _metrics['rejected'] += 1
+        print("ERROR: Decrypt executor saturated, rejecting job")
+        return None
+
+    with _metrics_lock:
+        _metrics['submitted'] += 1
+        _metrics['in_flight'] += 1
+        _metrics['max_in_flight'] = max(_metrics['max_in_flight'], _metrics['in_flight'])
+
+    if executor is None:
+        data = None
+        elapsed = 0.0
+        try:
+            data, elapsed = _decrypt_worker(encrypted_data, key)
+            return data
+        except Exception as e:
+            print(f"Error in decrypt executor: {str(e)}")
+            traceback.print_exc()
+            return None
+        finally:
+            _record_done(elapsed, len(data) if data else 0, data is not None)
+            _slots.release()
+
+    try:
+        future = executor.submit(_decrypt_worker, encrypted_data, key)
+    except Exception as e:
+        print(f"Error in decrypt executor: {str(e)}")
+        traceback.print_exc()
+        _record_done(0.0, 0, False)
+        _slots.release()
+        return None
+
+    # The slot is held until the job itself finishes, even if this caller
+    # stops waiting for it, so in_flight counts work the pool is really doing
+    future.add_done_callback(_release_slot)
+    try:
+        data, _ = future.result(timeout=timeout)
+        return data
+    except Exception as e:
+        print(f"Error in decrypt executor: {str(e)}")
+        traceback.print_exc()
+        return None
+
+
+def _release_slot(future):
+    data = None
+    elapsed = 0.0
+    try:
+        if not future.cancelled() and future.exception() is None:
+            data, elapsed = future.result()
+    finally:
+        _record_done(elapsed, len(data) if data else 0, data is not None)
+        _slots.release()
+
+
+def get_metrics():
+    """Return a snapshot of executor configuration and counters"""
+    _get_executor()
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+
+    snapshot['executor'] = _executor_kind
+    snapshot['max_pending'] = _max_pending
+    snapshot['queue_depth'] = snapshot['in_flight']
+    if snapshot['completed']:
+        snapshot['avg_decrypt_ms'] = round(snapshot['decrypt_seconds'] * 1000 / snapshot['completed'], 3)
+    snapshot['decrypt_seconds'] = round(snapshot['decrypt_seconds'], 6)
+    return snapshot
+
+
+def shutdown():
+    """Stop the executor; it is recreated on next use"""
+    global _executor, _executor_kind
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+        _executor = None
+        _executor_kind = None
@@ -0,0 +1,164 @@
+import os
+import time
+import random
+import threading
+from google.api_core.exceptions import NotFound, PreconditionFailed, ServiceUnavailable
+
+# Local stand-in for a Firebase/GCS bucket, used for testing and load runs
+# (STORAGE_BACKEND=fake). Objects live in memory, or under a directory when
+# FAKE_STORAGE_DIR is set so several worker processes can share them.
+#
+# Latency and failures can be injected to simulate a storage brownout:
+#   FAKE_STORAGE_LATENCY_MS   base latency added to every call (default 0)
+#   FAKE_STORAGE_JITTER_MS    extra random latency, 0..N ms (default 0)
+#   FAKE_STORAGE_ERROR_RATE   fraction of calls failing with 503 (default 0)
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def size(self):
+        data = self.bucket._get(self.name)
+        return None if data is None else len(data)
+
+    @property
+    def metadata(self):
+        return self.bucket._metadata.get(self.name)
+
+    @metadata.setter
+    def metadata(self, value):
+        self.bucket._metadata[self.name] = value
+
+    def exists(self, timeout=None):
+        self.bucket._simulate(timeout)
+        return self.bucket._get(self.name) is not None
+
+    def download_as_bytes(self, timeout=None, **kwargs):
+        self.bucket._simulate(timeout)
+        data = self.bucket._get(self.name)
+        if data is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        return data
+
+    def upload_from_string(self, data, content_type=None, timeout=None, if_generation_match=None, **kwargs):
+        self.bucket._simulate(timeout)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.bucket._lock:
+            if if_generation_match == 0 and self.bucket._get(self.name) is not None:
+                raise PreconditionFailed(f"Object already exists: {self.name}")
+            self.bucket._put(self.name, data)
+        self.bucket._content_types[self.name] = content_type
+
+    def delete(self, timeout=None):
+        self.bucket._simulate(timeout)
+        if not self.bucket._delete(self.name):
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+
+
+class FakeBucket:
+    def __init__(self, name='fake-bucket', root=None, latency_ms=0, jitter_ms=0, error_rate=0.0):
+        self.name = name
+        self.root = root
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._objects = {}
+        self._metadata = {}
+        self._content_types = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            root=os.getenv('FAKE_STORAGE_DIR') or None,
+            latency_ms=float(os.getenv('FAKE_STORAGE_LATENCY_MS', '0')),
+            jitter_ms=float(os.getenv('FAKE_STORAGE_JITTER_MS', '0')),
+            error_rate=float(os.getenv('FAKE_STORAGE_ERROR_RATE', '0')),
+        )
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+    def get_blob(self, name):
+        return FakeBlob(self, name) if self._get(name) is not None else None
+
+    def list_blobs(self, prefix=None, start_offset=None, max_results=None, timeout=None):
+        self._simulate(timeout)
+        names = [name for name in self._names()
+                 if (not prefix or name.startswith(prefix)) and (not start_offset or name >= start_offset)]
+        names.sort()
+        if max_results is not None:
+            names = names[:max_results]
+        return [FakeBlob(self, name) for name in names]
+
+    def copy_blob(self, blob, destination_bucket, new_name=None, timeout=None, if_generation_match=None, **kwargs):
+        self._simulate(timeout)
+        data = self._get(blob.name)
+        if data is None:
+            raise NotFound(f"No such object: {self.name}/{blob.name}")
+        new_name = new_name or blob.name
+        with destination_bucket._lock:
+            if if_generation_match == 0 and destination_bucket._get(new_name) is not None:
+                raise PreconditionFailed(f"Object already exists: {new_name}")
+            destination_bucket._put(new_name, data)
+        destination_bucket._content_types[new_name] = self._content_types.get(blob.name)
+        return FakeBlob(destination_bucket, new_name)
+
+    def _simulate(self, timeout=None):
+        """Apply injected latency and failures"""
+        delay = (self.latency_ms + random.random() * self.jitter_ms) / 1000.0
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake storage call exceeded {timeout}s")
+        if delay:
+            time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            raise ServiceUnavailable("Injected fake storage failure")
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def _names(self):
+        if not self.root:
+            return list(self._objects)
+        names = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                names.append(rel.replace(os.sep, '/'))
+        return names
+
+    def _get(self, name):
+        if not self.root:
+            return self._objects.get(name)
+        try:
+            with open(self._path(name), 'rb') as file:
+                return file.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def _put(self, name, data):
+        if not self.root:
+            self._objects[name] = data
+            return
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def _delete(self, name):
+        if not self.root:
+            return self._objects.pop(name, None) is not None
+        try:
+            os.unlink(self._path(name))
+            return True
+        except FileNotFoundError:
+            return False
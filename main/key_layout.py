@@ -0,0 +1,94 @@
+import os
+import re
+import hashlib
+
+# Object key layout for the certificate bucket.
+#
+# legacy (v1), flat at the bucket root:
+#   {serial}.pdf   {password}_key   qr_codes/{serial}.png   records/{serial}.json
+#   previews/{serial}.pdf
+#
+# v2, namespaced per tenant and spread over hashed prefixes so sequential
+# serials do not hotspot one key range:
+#   v2/{tenant}/certs/{shard}/{serial}.pdf
+#   v2/{tenant}/keys/{shard}/{password}_key
+#   v2/{tenant}/qr/{shard}/{serial}.png
+#   v2/{tenant}/records/{shard}/{serial}.json
+#   v2/{tenant}/previews/{shard}/{serial}.pdf
+#
+# shard is the first two hex digits of sha256(name). Verification only knows
+# the serial, so every component must be derivable from it: the issuance
+# year is kept in the certificate record rather than in the key.
+#
+# KEY_LAYOUT selects the layout for writes (default v2); reads try the
+# current layout first and fall back to legacy keys until they are migrated.
+# CERT_TENANT names the tenant namespace (default 'default').
+
+LAYOUT_LEGACY = 'v1'
+LAYOUT_V2 = 'v2'
+
+KINDS = ('pdf', 'key', 'qr', 'record', 'preview')
+
+_V2_DIRS = {'pdf': 'certs', 'key': 'keys', 'qr': 'qr', 'record': 'records', 'preview': 'previews'}
+
+_LEGACY_PATTERNS = (
+    ('qr', re.compile(r'^qr_codes/(?P<name>[^/]+)\.png$')),
+    ('record', re.compile(r'^records/(?P<name>[^/]+)\.json$')),
+    ('preview', re.compile(r'^previews/(?P<name>[^/]+)\.pdf$')),
+    ('key', re.compile(r'^(?P<name>[^/]+)_key$')),
+    ('pdf', re.compile(r'^(?P<name>[^/]+)\.pdf$')),
+)
+
+
+def current_layout():
+    return os.getenv('KEY_LAYOUT', LAYOUT_V2)
+
+
+def current_tenant():
+    return os.getenv('CERT_TENANT', 'default')
+
+
+def shard(name):
+    return hashlib.sha256(name.encode('utf-8')).hexdigest()[:2]
+
+
+def object_key(kind, name, layout=None, tenant=None):
+    """Storage key for an object; name is the serial, or the password for keys"""
+    layout = layout or current_layout()
+
+    if layout == LAYOUT_LEGACY:
+        return {
+            'pdf': f"{name}.pdf",
+            'key': f"{name}_key",
+            'qr': f"qr_codes/{name}.png",
+            'record': f"records/{name}.json",
+            'preview': f"previews/{name}.pdf",
+        }[kind]
+
+    suffix = {'pdf': '.pdf', 'key': '_key', 'qr': '.png', 'record': '.json', 'preview': '.pdf'}[kind]
+    return f"v2/{tenant or current_tenant()}/{_V2_DIRS[kind]}/{shard(name)}/{name}{suffix}"
+
+
+def kind_prefix(kind, tenant=None):
+    """Listing prefix for every object of one kind in the v2 layout"""
+    return f"v2/{tenant or current_tenant()}/{_V2_DIRS[kind]}/"
+
+
+def read_keys(kind, name):
+    """Keys to try in order when reading: current layout, then legacy"""
+    keys = [object_key(kind, name)]
+    legacy = object_key(kind, name, layout=LAYOUT_LEGACY)
+    if legacy not in keys:
+        keys.append(legacy)
+    return keys
+
+
+def parse_legacy_key(key):
+    """Return (kind, name) for a legacy key, or None if it is not one"""
+    if key.startswith('v2/'):
+        return None
+    for kind, pattern in _LEGACY_PATTERNS:
+        match = pattern.match(key)
+        if match:
+            return kind, match.group('name')
+    return None
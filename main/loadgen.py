@@ -0,0 +1,318 @@
+import os
+import sys
+import csv
+import json
+import time
+import uuid
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import traceback
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Load generator replaying QR-scan traffic against the Flask app.
+#
+# Traffic model:
+#   - scan sessions arrive as a Poisson process at --rate sessions/s, with
+#     bursts where the rate is multiplied by --burst-factor
+#   - the scanned serial follows a Zipf distribution (--zipf), giving a few
+#     hot certificates and a long tail of repeat scans
+#   - a session is GET /verify?serial= (page load), a think time, then
+#     POST /verify with the DOB; --invalid-dob of them send a wrong DOB
+#   - --status-fraction of sessions only call GET /verify/status
+#   - --process-fraction of sessions upload a certificate via POST /process
+#
+# Latency is measured from each request's scheduled start, so queueing in
+# the generator under overload is counted rather than hidden.
+#
+# By default the app runs in this process on a fake storage backend, seeded
+# with --serials certificates. Use --url to target a running instance
+# instead (start it with STORAGE_BACKEND=fake and CERTIFICATES_CSV pointing
+# at the file written by --write-csv to test a specific worker setup).
+#
+#   python loadgen.py --rate 20 --duration 60
+#   python loadgen.py --sweep 5,10,20,40,80 --duration 30
+#   python loadgen.py --url http://localhost:5000 --rate 50
+
+ROUTES = ('GET /verify', 'POST /verify', 'GET /verify/status', 'POST /process')
+
+out = sys.__stdout__
+
+
+def log(message):
+    print(message, file=out, flush=True)
+
+
+def write_population_csv(path, count):
+    """Write a certificates CSV with count serials and DOBs; returns [(serial, dob)]"""
+    rng = random.Random(1234)
+    population = []
+    for i in range(1, count + 1):
+        dob = f"{rng.randint(1, 28):02d}-{rng.randint(1, 12):02d}-{rng.randint(1970, 2005)}"
+        population.append((f"LOAD{i:06d}", dob))
+
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(['serial_number', 'dob'])
+        writer.writerows(population)
+    return population
+
+
+def read_population_csv(path):
+    with open(path, 'r', newline='', encoding='utf-8') as file:
+        return [(row['serial_number'].strip(), row['dob'].strip()) for row in csv.DictReader(file)]
+
+
+def start_local_server(server_logs):
+    """Run the app in-process on a free port; returns the base URL"""
+    from werkzeug.serving import make_server
+
+    if not server_logs:
+        sys.stdout = open(os.devnull, 'w')
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import server
+
+    httpd = make_server('127.0.0.1', 0, server.app, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True, name='loadgen-server').start()
+    return f"http://127.0.0.1:{httpd.server_port}"
+
+
+class Stats:
+    """Per-route latency samples and status counts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {route: [] for route in ROUTES}
+        self.statuses = {route: {} for route in ROUTES}
+
+    def record(self, route, latency, status):
+        with self.lock:
+            self.latencies[route].append(latency)
+            codes = self.statuses[route]
+            codes[status] = codes.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        rows = []
+        for route in ROUTES:
+            samples = sorted(self.latencies[route])
+            if not samples:
+                continue
+            rows.append({
+                'route': route,
+                'requests': len(samples),
+                'rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(percentile(samples, 50) * 1000, 1),
+                'p90_ms': round(percentile(samples, 90) * 1000, 1),
+                'p99_ms': round(percentile(samples, 99) * 1000, 1),
+                'max_ms': round(samples[-1] * 1000, 1),
+                'statuses': dict(sorted(self.statuses[route].items(), key=lambda item: str(item[0]))),
+            })
+        return rows
+
+
+def percentile(sorted_samples, pct):
+    index = min(len(sorted_samples) - 1, max(0, int(round(pct / 100.0 * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def http_request(method, url, body=None, headers=None, timeout=30):
+    """Send a request and return the status code (0 on connection failure)"""
+    req = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except Exception:
+        return 0
+
+
+def multipart_body(fields, file_field, filename, file_data):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n'.encode() + file_data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class LoadGenerator:
+    def __init__(self, base_url, population, pdf_data, args):
+        self.base_url = base_url.rstrip('/')
+        self.population = population
+        self.pdf_data = pdf_data
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        # Zipf weights over serials, most popular first
+        weights = [1.0 / (rank ** args.zipf) for rank in range(1, len(population) + 1)]
+        total = 0.0
+        self.cum_weights = []
+        for weight in weights:
+            total += weight
+            self.cum_weights.append(total)
+
+    def pick_serial(self):
+        with self.rng_lock:
+            return self.rng.choices(self.population, cum_weights=self.cum_weights)[0]
+
+    def timed(self, stats, route, scheduled, method, path, body=None, headers=None):
+        status = http_request(method, self.base_url + path, body, headers)
+        stats.record(route, time.monotonic() - scheduled, status)
+
+    def upload(self, stats, serial_number, scheduled):
+        body, content_type = multipart_body({'serialNumber': serial_number}, 'pdfFile', 'load.pdf', self.pdf_data)
+        self.timed(stats, 'POST /process', scheduled, 'POST', '/process', body, {'Content-Type': content_type})
+
+    def session(self, stats, scheduled):
+        """One scan session, timed from its scheduled arrival"""
+        with self.rng_lock:
+            kind = self.rng.random()
+            wrong_dob = self.rng.random() < self.args.invalid_dob
+            think = self.rng.uniform(0, self.args.think)
+        serial_number, dob = self.pick_serial()
+
+        if kind < self.args.process_fraction:
+            self.upload(stats, serial_number, scheduled)
+            return
+        if kind < self.args.process_fraction + self.args.status_fraction:
+            self.timed(stats, 'GET /verify/status', scheduled, 'GET', f'/verify/status?serial={serial_number}')
+            return
+
+        self.timed(stats, 'GET /verify', scheduled, 'GET', f'/verify?serial={serial_number}')
+        time.sleep(think)
+        if wrong_dob:
+            day, month, year = dob.split('-')
+            dob = f"{day}-{month}-{int(year) + 1}"
+        body = json.dumps({'serialNumber': serial_number, 'dob': dob}).encode()
+        self.timed(stats, 'POST /verify', time.monotonic(), 'POST', '/verify', body, {'Content-Type': 'application/json'})
+
+    def seed(self, workers):
+        """Issue every certificate in the population through POST /process"""
+        stats = Stats()
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for serial_number, _ in self.population:
+                executor.submit(self.upload, stats, serial_number, time.monotonic())
+        failures = sum(count for status, count in stats.statuses['POST /process'].items() if status != 200)
+        log(f"Seeded {len(self.population)} certificates in {time.monotonic() - started:.1f}s ({failures} failed)")
+
+    def run(self, rate, duration):
+        """Run open-loop arrivals at rate sessions/s for duration seconds"""
+        stats = Stats()
+        executor = ThreadPoolExecutor(max_workers=self.args.concurrency, thread_name_prefix='loadgen')
+        started = time.monotonic()
+        next_arrival = started
+        burst_until = 0.0
+
+        while next_arrival < started + duration:
+            now = time.monotonic()
+            if next_arrival > now:
+                time.sleep(next_arrival - now)
+
+            executor.submit(self.session, stats, next_arrival)
+
+            with self.rng_lock:
+                # Enter a burst with probability proportional to elapsed time
+                if next_arrival >= burst_until and self.rng.random() < self.args.burst_chance / max(rate, 1e-9):
+                    burst_until = next_arrival + self.rng.uniform(0.5, 1.5) * self.args.burst_length
+                current_rate = rate * (self.args.burst_factor if next_arrival < burst_until else 1.0)
+                next_arrival += self.rng.expovariate(current_rate)
+
+        executor.shutdown(wait=True)
+        return stats.summary(time.monotonic() - started)
+
+
+def print_summary(rate, rows):
+    log(f"\n=== {rate:g} sessions/s ===")
+    log(f"{'route':<20}{'reqs':>8}{'rps':>9}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}  statuses")
+    for row in rows:
+        log(f"{row['route']:<20}{row['requests']:>8}{row['rps']:>9}{row['p50_ms']:>10}{row['p90_ms']:>10}"
+            f"{row['p99_ms']:>10}{row['max_ms']:>10}  {row['statuses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay QR-scan traffic against the verification service")
+    parser.add_argument('--url', help="Target a running instance instead of an in-process fake-backed app")
+    parser.add_argument('--rate', type=float, default=10.0, help="Scan sessions per second")
+    parser.add_argument('--sweep', help="Comma-separated rates to run one after another")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds per rate")
+    parser.add_argument('--serials', type=int, default=200, help="Certificates in the population")
+    parser.add_argument('--csv', help="Existing certificates CSV to use as the population")
+    parser.add_argument('--write-csv', help="Write the generated population CSV here and exit")
+    parser.add_argument('--no-seed', action='store_true', help="Skip issuing the population before the run")
+    parser.add_argument('--pdf', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test.pdf'))
+    parser.add_argument('--zipf', type=float, default=1.1, help="Zipf exponent for serial popularity")
+    parser.add_argument('--invalid-dob', type=float, default=0.1, help="Fraction of POST /verify with a wrong DOB")
+    parser.add_argument('--status-fraction', type=float, default=0.2, help="Fraction of sessions using /verify/status")
+    parser.add_argument('--process-fraction', type=float, default=0.005, help="Fraction of sessions uploading via /process")
+    parser.add_argument('--think', type=float, default=3.0, help="Max seconds between page load and DOB submit")
+    parser.add_argument('--burst-chance', type=float, default=0.05, help="Bursts started per second")
+    parser.add_argument('--burst-factor', type=float, default=5.0, help="Rate multiplier during a burst")
+    parser.add_argument('--burst-length', type=float, default=3.0, help="Mean burst length in seconds")
+    parser.add_argument('--concurrency', type=int, default=256, help="Max concurrent sessions in the generator")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', help="Write all results as JSON to this file")
+    parser.add_argument('--server-logs', action='store_true', help="Show in-process server logs")
+    args = parser.parse_args()
+
+    if args.write_csv:
+        write_population_csv(args.write_csv, args.serials)
+        log(f"Wrote {args.serials} certificates to {args.write_csv}")
+        return
+
+    if args.url and not args.csv:
+        parser.error("--url needs --csv with the certificates CSV the target server uses")
+
+    if args.csv:
+        population = read_population_csv(args.csv)
+    else:
+        csv_path = os.path.join(tempfile.mkdtemp(prefix='loadgen-'), 'certificates.csv')
+        population = write_population_csv(csv_path, args.serials)
+        os.environ['CERTIFICATES_CSV'] = csv_path
+
+    if args.url:
+        base_url = args.url
+    else:
+        os.environ['STORAGE_BACKEND'] = 'fake'
+        os.environ.setdefault('CERT_RECORD_KEY', 'loadgen')
+        base_url = start_local_server(args.server_logs)
+        log(f"In-process app on {base_url} (fake storage)")
+
+    with open(args.pdf, 'rb') as file:
+        pdf_data = file.read()
+
+    generator = LoadGenerator(base_url, population, pdf_data, args)
+    if not args.no_seed:
+        generator.seed(workers=8)
+
+    rates = [float(rate) for rate in args.sweep.split(',')] if args.sweep else [args.rate]
+    results = []
+    for rate in rates:
+        rows = generator.run(rate, args.duration)
+        print_summary(rate, rows)
+        results.append({'rate': rate, 'routes': rows})
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        log(f"Error: {str(e)}")
+        traceback.print_exc()
+        sys.exit(1)
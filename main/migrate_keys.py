@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import argparse
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import processor
+import storage_client
+import key_layout
+
+# Copy legacy (flat) objects to the current key layout.
+#
+# The run is resumable: each migrated legacy key is appended to a checkpoint
+# file and skipped on the next run. Copies are server-side (copy_blob), so
+# object data never passes through this process.
+#
+# A destination that already exists is never overwritten: it was written
+# under the current layout after the cutover (re-issued certificate,
+# rotated key) and is newer than the legacy copy. Such objects are counted
+# as skipped.
+#
+#   python migrate_keys.py --workers 32 --checkpoint migrate.ckpt
+#   python migrate_keys.py --delete-source      # remove legacy objects once copied
+
+
+def load_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, 'r', encoding='utf-8') as file:
+        return {line.rstrip('\n') for line in file if line.strip()}
+
+
+def migrate_object(legacy_key, delete_source, dry_run, already_copied=False):
+    """Copy one legacy object to its new key; returns (new key, whether it was copied)"""
+    kind, name = key_layout.parse_legacy_key(legacy_key)
+    new_key = key_layout.object_key(kind, name)
+    if dry_run:
+        return new_key, True
+
+    copied = False
+    if not already_copied:
+        copied = storage_client.copy(legacy_key, new_key, if_absent=True)
+        if not copied:
+            print(f"Skipping {legacy_key}: {new_key} already exists")
+    if delete_source:
+        storage_client.delete(legacy_key)
+    return new_key, copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate legacy object keys to the current key layout")
+    parser.add_argument('--workers', type=int, default=16, help="Concurrent copy operations")
+    parser.add_argument('--checkpoint', default='migrate_keys.ckpt', help="Checkpoint file for resuming")
+    parser.add_argument('--delete-source', action='store_true', help="Delete legacy objects after copying")
+    parser.add_argument('--dry-run', action='store_true', help="Only print what would be copied")
+    args = parser.parse_args()
+
+    if key_layout.current_layout() == key_layout.LAYOUT_LEGACY:
+        print("KEY_LAYOUT is v1 - nothing to migrate")
+        return
+
+    if not processor.initialize_firebase():
+        raise RuntimeError("Firebase initialization failed")
+
+    bucket = storage_client.get_bucket()
+    done = load_checkpoint(args.checkpoint)
+    print(f"Checkpoint: {len(done)} objects already migrated")
+
+    checkpoint = None if args.dry_run else open(args.checkpoint, 'a', encoding='utf-8')
+    counts = {'copied': 0, 'skipped': 0, 'failed': 0}
+    started = time.time()
+
+    def report():
+        elapsed = time.time() - started
+        rate = counts['copied'] / elapsed if elapsed else 0
+        print(f"copied {counts['copied']}, skipped {counts['skipped']}, failed {counts['failed']} ({rate:.1f} objects/s)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='migrate') as executor:
+            pending = {}
+            # Listing is streamed, so only a window of copies is held in memory
+            for blob in bucket.list_blobs():
+                if key_layout.parse_legacy_key(blob.name) is None:
+                    continue
+                already_copied = blob.name in done
+                if already_copied and not args.delete_source:
+                    counts['skipped'] += 1
+                    continue
+
+                future = executor.submit(migrate_object, blob.name, args.delete_source, args.dry_run, already_copied)
+                pending[future] = blob.name
+                if len(pending) >= args.workers * 4:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        _record(future, pending.pop(future), counts, checkpoint, done, args.dry_run)
+                    if counts['copied'] and counts['copied'] % 1000 < len(finished):
+                        report()
+
+            for future in list(pending):
+                _record(future, pending.pop(future), counts, checkpoint, done, args.dry_run)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    report()
+    if counts['failed']:
+        print("Some objects failed - rerun to retry them")
+        sys.exit(1)
+
+
+def _record(future, legacy_key, counts, checkpoint, done, dry_run):
+    try:
+        new_key, copied = future.result()
+    except Exception as e:
+        counts['failed'] += 1
+        print(f"Failed to migrate {legacy_key}: {str(e)}")
+        return
+
+    counts['copied' if copied else 'skipped'] += 1
+    if dry_run:
+        print(f"{legacy_key} -> {new_key}")
+        return
+    if legacy_key in done:
+        return
+    checkpoint.write(legacy_key + '\n')
+    checkpoint.flush()
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,180 @@
+import hashlib
+import traceback
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NullObject,
+    StreamObject,
+)
+from PyPDF2.generic._data_structures import ContentStream
+
+# Size optimization for a PdfWriter before it is written out:
+#
+#   - page content streams are joined and Flate-compressed (merge_page leaves
+#     stamped pages with an uncompressed content stream)
+#   - other streams without a filter are Flate-compressed when that is smaller
+#   - /XObject, /Font and /ExtGState entries a page never uses are dropped
+#   - byte-identical streams (repeated images, fonts, forms) are stored once
+#   - objects no longer reachable from the document root are emptied
+#
+# Font subsetting is out of reach with PyPDF2; fonts are only deduplicated.
+# Works on PyPDF2 3.0.x writer internals (_objects, _add_object), which the
+# project pins, so the stage is opt-in (PDF_OPTIMIZE=1).
+
+PRUNED_RESOURCES = {
+    '/XObject': (b'Do',),
+    '/Font': (b'Tf',),
+    '/ExtGState': (b'gs',),
+}
+
+
+def _used_resource_names(operations):
+    used = {category: set() for category in PRUNED_RESOURCES}
+    for operands, operator in operations:
+        for category, operators in PRUNED_RESOURCES.items():
+            if operator in operators and operands:
+                used[category].add(operands[0])
+    return used
+
+
+def _compress_and_prune_pages(writer, stats):
+    """Compress page content and drop resource entries no page uses"""
+    # Resource dicts can be shared between pages, so collect usage per dict first
+    usage = {}
+    for page in writer.pages:
+        content = page.get_contents()
+        if content is None:
+            continue
+        if not isinstance(content, ContentStream):
+            content = ContentStream(content, writer)
+
+        used = _used_resource_names(content.operations)
+        # Streams must be indirect objects; the old content object becomes
+        # unreachable and is dropped later
+        page[NameObject('/Contents')] = writer._add_object(content.flate_encode())
+        stats['pages_compressed'] += 1
+
+        resources = page.get('/Resources')
+        if resources is None:
+            continue
+        resources = resources.get_object()
+        for category in PRUNED_RESOURCES:
+            entries = resources.get(category)
+            if entries is None:
+                continue
+            entries = entries.get_object()
+            names = usage.setdefault(id(entries), (entries, set()))[1]
+            names.update(used[category])
+
+    for entries, names in usage.values():
+        for name in list(entries.keys()):
+            if name not in names:
+                del entries[name]
+                stats['resources_dropped'] += 1
+
+
+def _compress_plain_streams(writer, stats):
+    for index, obj in enumerate(writer._objects):
+        if not isinstance(obj, StreamObject) or '/Filter' in obj or '/DecodeParms' in obj:
+            continue
+        data = obj.get_data()
+        if len(data) < 64:
+            continue
+        encoded = obj.flate_encode()
+        if len(encoded._data) < len(data):
+            writer._objects[index] = encoded
+            stats['streams_compressed'] += 1
+
+
+def _stream_digest(obj):
+    header = repr(sorted((key, repr(value)) for key, value in obj.items() if key != '/Length'))
+    digest = hashlib.sha256(header.encode('utf-8'))
+    digest.update(obj._data)
+    return digest.digest()
+
+
+def _remap(value, replacements, writer):
+    """Replace references to duplicate objects inside value, in place"""
+    if isinstance(value, IndirectObject):
+        target = replacements.get(value.idnum)
+        return IndirectObject(target, 0, writer) if target else value
+    if isinstance(value, DictionaryObject):
+        for key, item in list(value.items()):
+            remapped = _remap(item, replacements, writer)
+            if remapped is not item:
+                value[key] = remapped
+    elif isinstance(value, ArrayObject):
+        for i, item in enumerate(value):
+            remapped = _remap(item, replacements, writer)
+            if remapped is not item:
+                value[i] = remapped
+    return value
+
+
+def _deduplicate_streams(writer, stats):
+    # Repeat so objects referring to now-merged duplicates (e.g. an image's
+    # /SMask) can be merged themselves on the next pass
+    for _ in range(3):
+        canonical = {}
+        replacements = {}
+        for index, obj in enumerate(writer._objects):
+            if not isinstance(obj, StreamObject):
+                continue
+            digest = _stream_digest(obj)
+            if digest in canonical:
+                replacements[index + 1] = canonical[digest]
+            else:
+                canonical[digest] = index + 1
+
+        if not replacements:
+            return
+        for obj in writer._objects:
+            _remap(obj, replacements, writer)
+        for page in writer.pages:
+            _remap(page, replacements, writer)
+        stats['duplicates_merged'] += len(replacements)
+
+
+def _drop_unreachable(writer, stats):
+    reachable = set()
+    stack = [writer._root, writer._info, writer._pages]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, IndirectObject):
+            if value.pdf is not writer or value.idnum in reachable:
+                continue
+            reachable.add(value.idnum)
+            stack.append(writer._objects[value.idnum - 1])
+        elif isinstance(value, DictionaryObject):
+            stack.extend(value.values())
+        elif isinstance(value, ArrayObject):
+            stack.extend(value)
+
+    for index, obj in enumerate(writer._objects):
+        if obj is not None and index + 1 not in reachable and not isinstance(obj, NullObject):
+            # Keep the slot so object numbers and the xref table stay valid
+            writer._objects[index] = NullObject()
+            stats['objects_dropped'] += 1
+
+
+def optimize_writer(writer):
+    """Optimize a PdfWriter in place; returns counters describing what changed"""
+    stats = {
+        'pages_compressed': 0,
+        'streams_compressed': 0,
+        'resources_dropped': 0,
+        'duplicates_merged': 0,
+        'objects_dropped': 0,
+    }
+    try:
+        _compress_and_prune_pages(writer, stats)
+        _compress_plain_streams(writer, stats)
+        _deduplicate_streams(writer, stats)
+        _drop_unreachable(writer, stats)
+    except Exception as e:
+        # A partially optimized writer is still a valid document
+        print(f"Error optimizing PDF: {str(e)}")
+        traceback.print_exc()
+    return stats
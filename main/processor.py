@@ -1,18 +1,39 @@
 import os
 import csv
+import json
 import qrcode
 from cryptography.fernet import Fernet
 import base64
-from datetime import datetime
+from datetime import datetime, timezone
 import firebase_admin
-from firebase_admin import credentials, storage
+from firebase_admin import credentials
 import tempfile
 from dotenv import load_dotenv
 import traceback
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
 import io
+import hashlib
+import hmac
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PyPDF2 import PdfReader, PdfWriter
+import decrypt_executor
+import revocation
+import storage_client
+import key_layout
+import profiling
+import pdf_optimizer
+from fake_storage import FakeBucket
+
+# QR stamp size and distance from the page edge, in PDF points
+QR_SIZE = 80
+QR_MARGIN = 20
+
+# Corners in clockwise display order, used to map through page rotation
+QR_CORNERS = ('top-left', 'top-right', 'bottom-right', 'bottom-left')
 
 def convert_date_format(date_str):
     """Convert date from DD-MM-YYYY to YYYY-MM-DD"""
@@ -51,6 +72,7 @@ def create_easy_password(dob):
         traceback.print_exc()
         return None
 
+@profiling.stage('load_dob')
 def load_dob(serial_number):
     """Load DOB from CSV with enhanced error handling"""
     try:
@@ -58,7 +80,7 @@ def load_dob(serial_number):
         
         # Get the current script directory
         script_dir = os.path.dirname(__file__)
-        csv_path = os.path.join(script_dir, "certificates.csv")
+        csv_path = os.getenv("CERTIFICATES_CSV") or os.path.join(script_dir, "certificates.csv")
         
         print(f"CSV path: {csv_path}")
         print(f"CSV exists: {os.path.exists(csv_path)}")
@@ -93,6 +115,24 @@ def load_dob(serial_number):
         traceback.print_exc()
         return None
 
+def load_dob_index():
+    """Load every serial -> DOB mapping from the CSV in one pass, for bulk tools"""
+    try:
+        script_dir = os.path.dirname(__file__)
+        csv_path = os.getenv("CERTIFICATES_CSV") or os.path.join(script_dir, "certificates.csv")
+        
+        with open(csv_path, 'r', newline='', encoding='utf-8') as file:
+            index = {row['serial_number'].strip(): row['dob'].strip() for row in csv.DictReader(file)}
+        
+        print(f"Loaded {len(index)} DOB entries from {csv_path}")
+        return index
+        
+    except Exception as e:
+        print(f"Error reading CSV: {str(e)}")
+        traceback.print_exc()
+        return None
+
+@profiling.stage('encrypt_pdf')
 def encrypt_pdf(pdf_path, password):
     """Encrypt PDF using password and return encrypted data and key"""
     try:
@@ -123,12 +163,15 @@ def encrypt_pdf(pdf_path, password):
         traceback.print_exc()
         return None, None
 
+@profiling.stage('decrypt_pdf')
 def decrypt_pdf(encrypted_data, key):
-    """Decrypt PDF using key"""
+    """Decrypt PDF using key on the shared decrypt executor"""
     try:
         print(f"Decrypting PDF data (size: {len(encrypted_data)} bytes)")
-        cipher_suite = Fernet(key)
-        decrypted_data = cipher_suite.decrypt(encrypted_data)
+        decrypted_data = decrypt_executor.decrypt(encrypted_data, key)
+        if decrypted_data is None:
+            print("ERROR: Decryption failed or was rejected")
+            return None
         print(f"Decrypted data size: {len(decrypted_data)} bytes")
         return decrypted_data
     except Exception as e:
@@ -168,7 +211,7 @@ def generate_qr_code(data, serial_number):
             
             print(f"QR code file size: {len(qr_data)} bytes")
             
-            qr_filename = f"qr_codes/{serial_number}.png"
+            qr_filename = key_layout.object_key('qr', serial_number)
             if upload_to_firebase(qr_data, qr_filename, content_type='image/png'):
                 print(f"QR code uploaded to Firebase: {qr_filename}")
                 return qr_filename
@@ -188,28 +231,21 @@ def generate_qr_code(data, serial_number):
         traceback.print_exc()
         return None
 
+@profiling.stage('upload_to_firebase')
 def upload_to_firebase(data, filename, content_type=None):
-    """Upload data to Firebase Storage with enhanced error handling"""
+    """Upload data to Firebase Storage through the resilient storage client"""
     try:
         print(f"Uploading to Firebase: {filename}")
         print(f"Data size: {len(data)} bytes")
         
-        if not firebase_admin._apps:
+        if not storage_client.is_ready():
             print("ERROR: Firebase not initialized")
             return False
         
-        bucket = storage.bucket()
-        print(f"Got Firebase bucket: {bucket.name}")
+        if not isinstance(data, bytes):
+            content_type = content_type or 'application/octet-stream'
         
-        blob = bucket.blob(filename)
-        
-        if isinstance(data, bytes):
-            if content_type:
-                blob.upload_from_string(data, content_type=content_type)
-            else:
-                blob.upload_from_string(data)
-        else:
-            blob.upload_from_string(data, content_type=content_type or 'application/octet-stream')
+        storage_client.upload(filename, data, content_type=content_type)
         
         print(f"Successfully uploaded {filename}")
         return True
@@ -219,23 +255,22 @@ def upload_to_firebase(data, filename, content_type=None):
         traceback.print_exc()
         return False
 
+@profiling.stage('download_from_firebase')
 def download_from_firebase(filename):
-    """Download data from Firebase Storage with enhanced error handling"""
+    """Download data from Firebase Storage through the resilient storage client"""
     try:
         print(f"Downloading from Firebase: {filename}")
         
-        if not firebase_admin._apps:
+        if not storage_client.is_ready():
             print("ERROR: Firebase not initialized")
             return None
         
-        bucket = storage.bucket()
-        blob = bucket.blob(filename)
-        
-        if not blob.exists():
+        # One round trip: a missing object comes back as None
+        data = storage_client.download(filename)
+        if data is None:
             print(f"File {filename} not found in Firebase")
             return None
         
-        data = blob.download_as_bytes()
         print(f"Downloaded {filename} ({len(data)} bytes)")
         return data
         
@@ -244,6 +279,52 @@ def download_from_firebase(filename):
         traceback.print_exc()
         return None
 
+def exists_in_firebase(filename):
+    """Check whether an object exists in Firebase Storage without downloading it"""
+    try:
+        if not storage_client.is_ready():
+            print("ERROR: Firebase not initialized")
+            return None
+        
+        return storage_client.exists(filename)
+        
+    except Exception as e:
+        print(f"Error checking Firebase object {filename}: {str(e)}")
+        traceback.print_exc()
+        return None
+
+def download_object(kind, name):
+    """Download a certificate object, falling back to the legacy key layout"""
+    for object_key in key_layout.read_keys(kind, name):
+        data = download_from_firebase(object_key)
+        if data is not None:
+            return data
+    return None
+
+def fetch_object(kind, name):
+    """Like download_object, but only a missing object reads as None
+
+    Storage failures raise storage_client.StorageUnavailable, for callers
+    that must not report an outage as a missing certificate.
+    """
+    if not storage_client.is_ready():
+        raise storage_client.StorageUnavailable("Firebase not initialized")
+    for object_key in key_layout.read_keys(kind, name):
+        data = storage_client.download(object_key)
+        if data is not None:
+            return data
+    return None
+
+def exists_object(kind, name):
+    """Check a certificate object exists under the current or legacy key layout"""
+    found = False
+    for object_key in key_layout.read_keys(kind, name):
+        found = exists_in_firebase(object_key)
+        if found is None or found:
+            return found
+    return found
+
+@profiling.stage('process_certificate')
 def process_certificate(serial_number, pdf_path):
     """Main processing function with QR code embedding"""
     try:
@@ -257,10 +338,15 @@ def process_certificate(serial_number, pdf_path):
             return None
         
         # Check Firebase initialization
-        if not firebase_admin._apps:
+        if not storage_client.is_ready():
             print("ERROR: Firebase not initialized")
             return None
         
+        # The record must be signed, so fail before anything is uploaded
+        if not os.getenv("CERT_RECORD_KEY"):
+            print("ERROR: CERT_RECORD_KEY not set - cannot issue signed certificate records")
+            return None
+        
         # Load DOB from CSV
         print("Step 1: Loading DOB from CSV...")
         dob = load_dob(serial_number)
@@ -313,7 +399,7 @@ def process_certificate(serial_number, pdf_path):
             
             # Upload encrypted PDF to Firebase
             print("Step 6: Uploading encrypted PDF to Firebase...")
-            if not upload_to_firebase(encrypted_data, f'{serial_number}.pdf', content_type='application/pdf'):
+            if not upload_to_firebase(encrypted_data, key_layout.object_key('pdf', serial_number), content_type='application/pdf'):
                 print("ERROR: Could not upload encrypted PDF to Firebase")
                 return None
             
@@ -321,19 +407,43 @@ def process_certificate(serial_number, pdf_path):
             
             # Upload encryption key to Firebase
             print("Step 7: Uploading encryption key to Firebase...")
-            if not upload_to_firebase(key, f'{easy_password}_key', content_type='application/octet-stream'):
+            if not upload_to_firebase(key, key_layout.object_key('key', easy_password), content_type='application/octet-stream'):
                 print("ERROR: Could not upload encryption key to Firebase")
                 return None
             
             print("Encryption key uploaded successfully")
             
+            # Record digest of the stamped PDF for cheap status checks
+            print("Step 8: Uploading signed certificate record...")
+            with open(temp_pdf_path, 'rb') as stamped_file:
+                stamped_pdf = stamped_file.read()
+            record = build_certificate_record(serial_number, stamped_pdf, len(encrypted_data))
+            if not record or not upload_to_firebase(json.dumps(record, separators=(',', ':')).encode('utf-8'),
+                                                    key_layout.object_key('record', serial_number),
+                                                    content_type='application/json'):
+                print("ERROR: Could not upload certificate record to Firebase")
+                return None
+            
+            print(f"Certificate record uploaded (sha256 {record['sha256']})")
+            
             # Upload QR code image to Firebase for reference
-            print("Step 8: Uploading QR code image to Firebase...")
-            qr_filename = f"qr_codes/{serial_number}.png"
+            print("Step 9: Uploading QR code image to Firebase...")
+            qr_filename = key_layout.object_key('qr', serial_number)
             if not upload_to_firebase(qr_code_data, qr_filename, content_type='image/png'):
                 print("WARNING: Could not upload QR code image to Firebase")
                 # This is not a critical error, continue processing
             
+            # Store an encrypted first-page extract so verification can skip the full PDF
+            print("Step 10: Uploading first-page preview...")
+            preview_data = extract_first_page(stamped_pdf)
+            if not preview_data or not upload_to_firebase(Fernet(key).encrypt(preview_data),
+                                                          key_layout.object_key('preview', serial_number),
+                                                          content_type='application/pdf'):
+                print("WARNING: Could not upload preview, verification will extract it on demand")
+                # This is not a critical error, continue processing
+            else:
+                print(f"Preview uploaded ({len(preview_data)} of {len(stamped_pdf)} bytes)")
+            
             print(f"=== PROCESSING COMPLETED SUCCESSFULLY ===")
             print(f"QR Code embedded in PDF")
             print(f"Verification URL: {qr_url}")
@@ -352,6 +462,133 @@ def process_certificate(serial_number, pdf_path):
         return None
 
 
+def sign_record(record):
+    """Return the HMAC-SHA256 signature of a record, or None if no signing key is set"""
+    signing_key = os.getenv("CERT_RECORD_KEY")
+    if not signing_key:
+        return None
+    
+    unsigned = {k: v for k, v in record.items() if k != 'sig'}
+    payload = json.dumps(unsigned, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hmac.new(signing_key.encode('utf-8'), payload, hashlib.sha256).hexdigest()
+
+
+def build_certificate_record(serial_number, pdf_data, encrypted_size):
+    """Build the signed issuance record for a stamped PDF; None without CERT_RECORD_KEY"""
+    record = {
+        'v': 1,
+        'serial': serial_number,
+        'sha256': hashlib.sha256(pdf_data).hexdigest(),
+        'size': len(pdf_data),
+        'encrypted_size': encrypted_size,
+        'issued_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'tenant': key_layout.current_tenant(),
+        'status': 'issued',
+    }
+    
+    signature = sign_record(record)
+    if not signature:
+        print("ERROR: CERT_RECORD_KEY not set - cannot sign certificate record")
+        return None
+    record['sig'] = signature
+    return record
+
+
+def load_certificate_record(serial_number):
+    """Download and check a certificate record; returns the record or None
+
+    Records are only trusted with a valid signature, so without
+    CERT_RECORD_KEY no record is accepted. Storage failures raise
+    storage_client.StorageUnavailable rather than read as a missing record.
+    """
+    try:
+        data = fetch_object('record', serial_number)
+        if not data:
+            return None
+        
+        record = json.loads(data)
+        expected = sign_record(record)
+        if not expected:
+            print("ERROR: CERT_RECORD_KEY not set - cannot check certificate record")
+            return None
+        if not hmac.compare_digest(expected, record.get('sig') or ''):
+            print(f"ERROR: Signature mismatch on certificate record {serial_number}")
+            return None
+        
+        if record.get('serial') != serial_number:
+            print(f"ERROR: Certificate record does not match serial {serial_number}")
+            return None
+        return record
+        
+    except storage_client.StorageUnavailable:
+        raise
+    except Exception as e:
+        print(f"Error loading certificate record: {str(e)}")
+        traceback.print_exc()
+        return None
+
+
+def update_certificate_record(serial_number, **changes):
+    """Apply changes to a certificate record, re-sign and upload it"""
+    try:
+        record = load_certificate_record(serial_number)
+    except storage_client.StorageUnavailable as e:
+        print(f"Error loading certificate record: {str(e)}")
+        return False
+    if not record:
+        return False
+    
+    record.update(changes)
+    record.pop('sig', None)
+    record['sig'] = sign_record(record)
+    
+    return upload_to_firebase(json.dumps(record, separators=(',', ':')).encode('utf-8'),
+                              key_layout.object_key('record', serial_number), content_type='application/json')
+
+
+def get_certificate_status(serial_number):
+    """Answer valid/revoked/unknown from the certificate record alone
+
+    Returns status 'unavailable' (with an error) when the revocation list is
+    not loaded yet, storage cannot be reached, or records cannot be checked
+    because CERT_RECORD_KEY is not set.
+    """
+    if not revocation.is_loaded():
+        return {'serialNumber': serial_number, 'status': 'unavailable',
+                'error': 'Revocation list not loaded yet, please retry shortly'}
+    
+    revoked = revocation.get_revocation(serial_number)
+    if revoked:
+        return {
+            'serialNumber': serial_number,
+            'status': 'revoked',
+            'revoked_at': revoked.get('revoked_at'),
+            'reason': revoked.get('reason'),
+        }
+    
+    if not os.getenv("CERT_RECORD_KEY"):
+        return {'serialNumber': serial_number, 'status': 'unavailable',
+                'error': 'Certificate records cannot be checked - signing key not configured'}
+    
+    try:
+        record = load_certificate_record(serial_number)
+    except storage_client.StorageUnavailable as e:
+        print(f"Storage unavailable loading record {serial_number}: {str(e)}")
+        return {'serialNumber': serial_number, 'status': 'unavailable',
+                'error': 'Certificate storage unavailable, please retry shortly'}
+    if not record:
+        return {'serialNumber': serial_number, 'status': 'unknown'}
+    
+    return {
+        'serialNumber': serial_number,
+        'status': 'revoked' if record.get('status') == 'revoked' else 'valid',
+        'issued_at': record.get('issued_at'),
+        'sha256': record.get('sha256'),
+        'size': record.get('size'),
+    }
+
+
+@profiling.stage('generate_qr_code_data')
 def generate_qr_code_data(data, serial_number):
     """Generate QR code and return image data as bytes"""
     try:
@@ -386,34 +623,67 @@ def generate_qr_code_data(data, serial_number):
         return None
 
 
-def embed_qr_in_pdf(pdf_path, qr_image_data, output_path):
-    """Embed QR code in top-right corner of PDF"""
+@profiling.stage('embed_qr_in_pdf')
+def embed_qr_in_pdf(pdf_path, qr_image_data, output_path, placement=None, corner=None, optimize=None):
+    """Embed QR code in PDF pages according to the configured placement
+
+    placement is 'first' (default), 'all' or a zero-based page number;
+    corner is one of QR_CORNERS as seen by the reader, after page rotation.
+    optimize (default: PDF_OPTIMIZE=1 env, off otherwise) shrinks the output
+    before writing.
+    """
     try:
         print(f"Embedding QR code in PDF: {pdf_path}")
         
+        placement = placement if placement is not None else os.getenv("QR_PLACEMENT", "first")
+        corner = corner or os.getenv("QR_CORNER", "top-right")
+        if optimize is None:
+            optimize = os.getenv("PDF_OPTIMIZE", "0") == "1"
+        
+        if corner not in QR_CORNERS:
+            print(f"ERROR: Unknown QR corner: {corner}")
+            return False
+        
         # Read the original PDF
         pdf_reader = PdfReader(pdf_path)
         pdf_writer = PdfWriter()
         
-        # Create QR code overlay
-        qr_overlay = create_qr_overlay(qr_image_data)
-        
-        if not qr_overlay:
-            print("ERROR: Could not create QR overlay")
+        target_pages = select_qr_pages(placement, len(pdf_reader.pages))
+        if target_pages is None:
+            print(f"ERROR: Invalid QR placement: {placement}")
             return False
         
-        # Process each page (or just the first page)
+        print(f"QR placement: {placement} ({corner}), pages: {sorted(target_pages)}")
+        
+        # Pages of this document with the same geometry share one overlay;
+        # the QR differs per certificate, so overlays are not kept across calls
+        overlays = {}
         for page_num, page in enumerate(pdf_reader.pages):
-            if page_num == 0:  # Only add QR to first page
+            if page_num in target_pages:
+                geometry = get_page_geometry(page)
+                qr_overlay = overlays.get(geometry)
+                if qr_overlay is None:
+                    qr_overlay = overlays[geometry] = create_qr_overlay(qr_image_data, geometry, corner)
+                
+                if not qr_overlay:
+                    print("ERROR: Could not create QR overlay")
+                    return False
+                
                 # Merge QR overlay with the page
                 page.merge_page(qr_overlay)
             pdf_writer.add_page(page)
         
+        if optimize:
+            optimize_pdf(pdf_writer)
+        
         # Write the modified PDF
         with open(output_path, 'wb') as output_file:
             pdf_writer.write(output_file)
         
+        original_size = os.path.getsize(pdf_path)
+        output_size = os.path.getsize(output_path)
         print(f"QR code embedded successfully: {output_path}")
+        print(f"PDF size: {original_size} -> {output_size} bytes ({original_size - output_size} bytes saved)")
         return True
         
     except Exception as e:
@@ -422,59 +692,160 @@ def embed_qr_in_pdf(pdf_path, qr_image_data, output_path):
         return False
 
 
-def create_qr_overlay(qr_image_data):
-    """Create QR code overlay for PDF"""
+@profiling.stage('optimize_pdf')
+def optimize_pdf(pdf_writer):
+    """Run the size optimization stage on a writer before it is saved"""
+    stats = pdf_optimizer.optimize_writer(pdf_writer)
+    print(f"PDF optimization: {stats}")
+    return stats
+
+
+@profiling.stage('extract_first_page')
+def extract_first_page(pdf_data):
+    """Single-page PDF of page 0 (the stamped page); None on failure
+
+    Only objects reachable from that page are written. With PDF_OPTIMIZE=1
+    the extract also goes through the size optimization stage.
+    """
+    try:
+        pdf_reader = PdfReader(io.BytesIO(pdf_data))
+        pdf_writer = PdfWriter()
+        pdf_writer.add_page(pdf_reader.pages[0])
+        if os.getenv("PDF_OPTIMIZE", "0") == "1":
+            # Resource entries only later pages use are pruned
+            pdf_optimizer.optimize_writer(pdf_writer)
+        
+        output = io.BytesIO()
+        pdf_writer.write(output)
+        return output.getvalue()
+    except Exception as e:
+        print(f"Error extracting first page: {str(e)}")
+        traceback.print_exc()
+        return None
+
+
+def select_qr_pages(placement, page_count):
+    """Return the set of page indexes that receive a QR code, or None if invalid"""
+    if page_count == 0:
+        return set()
+    
+    placement = str(placement).strip().lower()
+    if placement == 'first':
+        return {0}
+    if placement == 'last':
+        return {page_count - 1}
+    if placement == 'all':
+        return set(range(page_count))
+    
+    try:
+        page_index = int(placement)
+    except ValueError:
+        return None
+    
+    if not 0 <= page_index < page_count:
+        return None
+    return {page_index}
+
+
+def get_page_geometry(page):
+    """Read MediaBox, CropBox and rotation of a page as a hashable tuple"""
+    mediabox = page.mediabox
+    cropbox = page.cropbox
+    rotation = (page.rotation or 0) % 360
+    
+    return (
+        (float(mediabox.left), float(mediabox.bottom), float(mediabox.right), float(mediabox.top)),
+        (float(cropbox.left), float(cropbox.bottom), float(cropbox.right), float(cropbox.top)),
+        rotation,
+    )
+
+
+def compute_qr_position(geometry, corner, qr_size=QR_SIZE, margin=QR_MARGIN):
+    """Return the (x, y) of the QR code in unrotated page space
+
+    The corner is given as displayed, so for a rotated page it is mapped back
+    to the corner of the CropBox that ends up there after rotation.
+    """
+    _, (x0, y0, x1, y1), rotation = geometry
+    
+    # Display rotates clockwise, so walk the corner list backwards
+    turns = rotation // 90
+    unrotated_corner = QR_CORNERS[(QR_CORNERS.index(corner) - turns) % 4]
+    
+    if unrotated_corner.endswith('left'):
+        x_position = x0 + margin
+    else:
+        x_position = x1 - qr_size - margin
+    
+    if unrotated_corner.startswith('top'):
+        y_position = y1 - qr_size - margin
+    else:
+        y_position = y0 + margin
+    
+    return x_position, y_position
+
+
+@profiling.stage('create_qr_overlay')
+def create_qr_overlay(qr_image_data, geometry=None, corner='top-right'):
+    """Create QR code overlay for PDF matching the given page geometry"""
     try:
+        if geometry is None:
+            width, height = letter
+            geometry = ((0.0, 0.0, width, height), (0.0, 0.0, width, height), 0)
+        
         # Create a BytesIO buffer for the overlay PDF
         packet = io.BytesIO()
         
-        # Create canvas for overlay
-        c = canvas.Canvas(packet, pagesize=letter)
-        width, height = letter
+        # Overlay covers the whole MediaBox so coordinates match the target page
+        (_, _, media_right, media_top), _, rotation = geometry
+        c = canvas.Canvas(packet, pagesize=(media_right, media_top))
         
-        # Save QR image temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_qr:
-            temp_qr.write(qr_image_data)
-            temp_qr_path = temp_qr.name
+        x_position, y_position = compute_qr_position(geometry, corner)
         
-        try:
-            # Position QR code in top-right corner
-            qr_size = 80  # Size of QR code
-            x_position = width - qr_size - 20  # 20 pixels from right edge
-            y_position = height - qr_size - 20  # 20 pixels from top
-            
-            # Draw QR code on canvas
-            c.drawImage(temp_qr_path, x_position, y_position, qr_size, qr_size)
-            c.save()
-            
-            # Move to beginning of BytesIO buffer
-            packet.seek(0)
-            
-            # Create PDF from overlay
-            overlay_pdf = PdfReader(packet)
-            return overlay_pdf.pages[0]
-            
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_qr_path)
-            except:
-                pass
+        # Rotate around the QR centre so it reads upright on rotated pages
+        c.saveState()
+        c.translate(x_position + QR_SIZE / 2, y_position + QR_SIZE / 2)
+        c.rotate(rotation)
+        c.drawImage(ImageReader(io.BytesIO(qr_image_data)), -QR_SIZE / 2, -QR_SIZE / 2, QR_SIZE, QR_SIZE)
+        c.restoreState()
+        c.save()
+        
+        # Move to beginning of BytesIO buffer
+        packet.seek(0)
+        
+        # Create PDF from overlay
+        overlay_page = PdfReader(packet).pages[0]
+        
+        return overlay_page
                 
     except Exception as e:
         print(f"Error creating QR overlay: {str(e)}")
         traceback.print_exc()
         return None
 
-def verify_certificate(serial_number, dob):
-    """Verify certificate and return decrypted PDF with enhanced error handling"""
+@profiling.stage('verify_certificate')
+def verify_certificate(serial_number, dob, preview=False):
+    """Verify certificate and return decrypted PDF with enhanced error handling
+
+    With preview, only the first page is returned: the extract stored at
+    issuance, or one cut from the full PDF for certificates issued before.
+    """
     try:
         print(f"=== VERIFYING CERTIFICATE ===")
         print(f"Serial Number: {serial_number}")
         print(f"DOB: {dob}")
+        print(f"Preview: {preview}")
+        
+        # Reject revoked certificates before any storage I/O
+        if not revocation.is_loaded():
+            print("Error: Revocation list not loaded yet")
+            return None
+        if revocation.is_revoked(serial_number):
+            print(f"Error: Certificate {serial_number} has been revoked")
+            return None
         
         # Check Firebase initialization
-        if not firebase_admin._apps:
+        if not storage_client.is_ready():
             print("ERROR: Firebase not initialized")
             return None
         
@@ -484,16 +855,19 @@ def verify_certificate(serial_number, dob):
             print("Error: Could not create password")
             return None
         
-        # Download encrypted PDF from Firebase
+        # Download encrypted PDF (or its stored preview) from Firebase
         print("Step 1: Downloading encrypted PDF...")
-        encrypted_data = download_from_firebase(f'{serial_number}.pdf')
+        encrypted_data = download_object('preview', serial_number) if preview else None
+        extract_preview = preview and not encrypted_data
+        if not encrypted_data:
+            encrypted_data = download_object('pdf', serial_number)
         if not encrypted_data:
             print("Error: Could not download encrypted PDF")
             return None
         
         # Download encryption key from Firebase
         print("Step 2: Downloading encryption key...")
-        key = download_from_firebase(f'{easy_password}_key')
+        key = download_object('key', easy_password)
         if not key:
             print("Error: Could not download encryption key")
             return None
@@ -505,6 +879,13 @@ def verify_certificate(serial_number, dob):
             print("Error: Could not decrypt PDF")
             return None
         
+        if extract_preview:
+            print("No stored preview, extracting first page...")
+            decrypted_data = extract_first_page(decrypted_data)
+            if not decrypted_data:
+                print("Error: Could not extract preview")
+                return None
+        
         print("=== CERTIFICATE VERIFIED SUCCESSFULLY ===")
         return decrypted_data
         
@@ -513,18 +894,136 @@ def verify_certificate(serial_number, dob):
         traceback.print_exc()
         return None
 
+def verify_token_mac(token, key):
+    """Check the HMAC of a Fernet token without decrypting the payload
+
+    key may hold several keys, one per line, while a key rotation is running.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token)
+        if len(data) < 57 or data[0] != 0x80:
+            return False
+        for line in key.splitlines():
+            if not line.strip():
+                continue
+            signing_key = base64.urlsafe_b64decode(line.strip())[:16]
+            expected = hmac.new(signing_key, data[:-32], hashlib.sha256).digest()
+            if hmac.compare_digest(expected, data[-32:]):
+                return True
+        return False
+    except Exception:
+        return False
+
+
+@profiling.stage('check_certificate')
+def check_certificate(serial_number, dob, mode='integrity', key_cache=None):
+    """Check a single certificate without returning the PDF
+
+    mode is 'exists' (object present), 'integrity' (key found and token MAC
+    valid, the default) or 'decrypt' (full decryption). Returns a result dict.
+    """
+    result = {'serialNumber': serial_number, 'valid': False}
+    try:
+        if not serial_number or not dob or not re.match(r'^\d{2}-\d{2}-\d{4}$', dob):
+            result['status'] = 'invalid_request'
+            return result
+        
+        if not revocation.is_loaded():
+            result['status'] = 'unavailable'
+            return result
+        if revocation.is_revoked(serial_number):
+            result['status'] = 'revoked'
+            return result
+        
+        easy_password = create_easy_password(dob)
+        if not easy_password:
+            result['status'] = 'invalid_request'
+            return result
+        
+        if mode == 'exists':
+            found = exists_object('pdf', serial_number)
+            result['status'] = 'error' if found is None else ('exists' if found else 'not_found')
+            result['valid'] = bool(found)
+            return result
+        
+        encrypted_data = fetch_object('pdf', serial_number)
+        if not encrypted_data:
+            result['status'] = 'not_found'
+            return result
+        result['size'] = len(encrypted_data)
+        
+        # Keys are stored per password, so rows sharing a DOB share one fetch;
+        # a failed fetch raises and is never cached
+        if key_cache is not None and easy_password in key_cache:
+            key = key_cache[easy_password]
+        else:
+            key = fetch_object('key', easy_password)
+            if key_cache is not None:
+                key_cache[easy_password] = key
+        if not key:
+            result['status'] = 'invalid_credentials'
+            return result
+        
+        if mode == 'decrypt':
+            ok = decrypt_executor.decrypt(encrypted_data, key) is not None
+        else:
+            ok = verify_token_mac(encrypted_data, key)
+        
+        result['status'] = 'valid' if ok else 'invalid_credentials'
+        result['valid'] = ok
+        return result
+        
+    except storage_client.StorageUnavailable as e:
+        # An outage is not an audit result
+        print(f"Storage unavailable checking certificate {serial_number}: {str(e)}")
+        result['status'] = 'error'
+        return result
+    except Exception as e:
+        print(f"Error checking certificate {serial_number}: {str(e)}")
+        traceback.print_exc()
+        result['status'] = 'error'
+        return result
+
+
+def verify_certificates_batch(pairs, mode='integrity', workers=None):
+    """Check many (serial, DOB) pairs with concurrent storage fetches
+
+    Yields one result dict per pair, in input order. At most 2 x workers
+    checks are in flight, so memory stays bounded for large batches.
+    """
+    workers = workers or int(os.getenv('BATCH_VERIFY_WORKERS', '16'))
+    window = workers * 2
+    key_cache = {}
+    pending = deque()
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-verify') as executor:
+        for serial_number, dob in pairs:
+            pending.append(executor.submit(check_certificate, serial_number, dob, mode, key_cache))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        
+        while pending:
+            yield pending.popleft().result()
+
+
 def initialize_firebase():
     """Initialize Firebase with enhanced error handling"""
     try:
         print("=== INITIALIZING FIREBASE ===")
         
-        if firebase_admin._apps:
+        if storage_client.is_ready():
             print("Firebase already initialized")
             return True
         
         # Load environment variables from .env
         load_dotenv()
         print("Environment variables loaded")
+        
+        # Local fake bucket for tests and load runs
+        if os.getenv("STORAGE_BACKEND") == "fake":
+            storage_client.set_bucket(FakeBucket.from_env())
+            print("=== USING FAKE STORAGE BACKEND ===")
+            return True
 
         # Get the path from environment variable
         cred_path = os.getenv("FIREBASE_KEY_PATH")
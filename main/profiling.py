@@ -0,0 +1,252 @@
+import os
+import sys
+import time
+import signal
+import tempfile
+import threading
+import traceback
+import tracemalloc
+import functools
+from collections import Counter
+
+# On-demand profiling for the Flask workers.
+#
+# A profile session is time-bounded and runs in a background thread of the
+# worker it was started in:
+#   'cpu'     samples every thread's stack at a fixed interval and writes
+#             collapsed stacks ({pid}-{ts}-cpu.folded), the input format of
+#             flamegraph.pl and speedscope
+#   'memory'  takes tracemalloc snapshots at the start and end and writes the
+#             allocation growth per traceback, as collapsed stacks weighted by
+#             bytes plus a top-N text report
+#
+# Functions wrapped with @stage(name) also get per-stage call counts, wall
+# time and (in memory mode) traced allocation deltas in {pid}-{ts}-stages.txt.
+# When no session is running, @stage costs one global check per call.
+#
+# Start a session through POST /admin/profile (profiles the worker that
+# serves the request) or by sending SIGUSR2 to each worker process, e.g.
+# `pkill -USR2 -f gunicorn`, to profile all of them.
+#
+# Configuration (environment variables):
+#   PROFILE_DIR            output directory (default: {tmp}/secure-cert-profiles)
+#   PROFILE_MAX_SECONDS    upper bound for a session (default 120)
+#   PROFILE_SIGNAL_MODE    mode used for SIGUSR2 (default cpu)
+#   PROFILE_SIGNAL_SECONDS duration used for SIGUSR2 (default 30)
+
+MODES = ('cpu', 'memory')
+MAX_STACK_DEPTH = 64
+
+_session = None
+_session_lock = threading.Lock()
+_finished = []
+
+
+def profile_dir():
+    path = os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'secure-cert-profiles')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def stage(name):
+    """Attribute time (and allocations, in memory mode) of a function to a pipeline stage"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            session = _session
+            if session is None:
+                return fn(*args, **kwargs)
+
+            memory = session['mode'] == 'memory' and tracemalloc.is_tracing()
+            before = tracemalloc.get_traced_memory()[0] if memory else 0
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                allocated = tracemalloc.get_traced_memory()[0] - before if memory else 0
+                with _session_lock:
+                    stats = session['stages'].setdefault(name, {'calls': 0, 'seconds': 0.0, 'alloc_bytes': 0})
+                    stats['calls'] += 1
+                    stats['seconds'] += elapsed
+                    stats['alloc_bytes'] += allocated
+        return wrapper
+    return decorator
+
+
+def _frame_label(frame):
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f"{module}.{frame.f_code.co_name}"
+
+
+def _collapse(frame):
+    """Root-first 'a;b;c' stack string for a frame"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+def _run_cpu(session, interval):
+    samples = Counter()
+    own_id = threading.get_ident()
+    deadline = time.monotonic() + session['duration']
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                samples[_collapse(frame)] += 1
+        time.sleep(interval)
+
+    with open(session['output'], 'w', encoding='utf-8') as file:
+        for stack, count in samples.most_common():
+            file.write(f"{stack} {count}\n")
+    session['samples'] = sum(samples.values())
+
+
+def _run_memory(session, interval):
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(MAX_STACK_DEPTH)
+    try:
+        first = tracemalloc.take_snapshot()
+        time.sleep(session['duration'])
+        last = tracemalloc.take_snapshot()
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    diffs = [diff for diff in last.compare_to(first, 'traceback') if diff.size_diff > 0]
+    with open(session['output'], 'w', encoding='utf-8') as file:
+        for diff in diffs:
+            stack = ';'.join(
+                f"{os.path.splitext(os.path.basename(frame.filename))[0]}:{frame.lineno}"
+                for frame in diff.traceback  # oldest frame first
+            )
+            file.write(f"{stack} {diff.size_diff}\n")
+
+    with open(session['output'].replace('.folded', '-top.txt'), 'w', encoding='utf-8') as file:
+        for diff in diffs[:50]:
+            file.write(f"{diff.size_diff / 1024:.1f} KiB in {diff.count_diff} blocks\n")
+            for line in diff.traceback.format():
+                file.write(f"    {line}\n")
+            file.write("\n")
+    session['growth_bytes'] = sum(diff.size_diff for diff in diffs)
+
+
+def _run(session, interval):
+    global _session
+    try:
+        if session['mode'] == 'memory':
+            _run_memory(session, interval)
+        else:
+            _run_cpu(session, interval)
+        session['status'] = 'finished'
+    except Exception as e:
+        print(f"Error in profile session: {str(e)}")
+        traceback.print_exc()
+        session['status'] = 'failed'
+        session['error'] = str(e)
+    finally:
+        with _session_lock:
+            _session = None
+        _write_stages(session)
+        _finished.append(session)
+        del _finished[:-10]
+        print(f"Profile session finished: {session['output']}")
+
+
+def _write_stages(session):
+    path = session['output'].replace(f"-{session['mode']}.folded", '-stages.txt')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(f"{'stage':<28}{'calls':>8}{'total s':>12}{'avg ms':>10}{'alloc KiB':>12}\n")
+        for name, stats in sorted(session['stages'].items(), key=lambda item: -item[1]['seconds']):
+            avg_ms = stats['seconds'] * 1000 / stats['calls'] if stats['calls'] else 0
+            file.write(f"{name:<28}{stats['calls']:>8}{stats['seconds']:>12.3f}{avg_ms:>10.2f}"
+                       f"{stats['alloc_bytes'] / 1024:>12.1f}\n")
+    session['stages_output'] = path
+
+
+def start_profile(mode='cpu', duration=30, interval_ms=5):
+    """Start a time-bounded profile session; returns its description, or None if one is running"""
+    global _session
+
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {', '.join(MODES)}")
+    duration = max(1.0, min(float(duration), float(os.getenv('PROFILE_MAX_SECONDS', '120'))))
+    interval = max(0.001, float(interval_ms) / 1000.0)
+
+    with _session_lock:
+        if _session is not None:
+            return None
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        session = {
+            'mode': mode,
+            'pid': os.getpid(),
+            'duration': duration,
+            'started_at': stamp,
+            'status': 'running',
+            'output': os.path.join(profile_dir(), f"{os.getpid()}-{stamp}-{mode}.folded"),
+            'stages': {},
+        }
+        _session = session
+
+    threading.Thread(target=_run, args=(session, interval), daemon=True, name='profiler').start()
+    print(f"Profile session started: {mode} for {duration:g}s -> {session['output']}")
+    return _describe(session)
+
+
+def _describe(session):
+    return {key: value for key, value in session.items() if key != 'stages'}
+
+
+def get_profile_status():
+    """Current session (if any) and recently finished sessions of this worker"""
+    current = _session
+    return {
+        'pid': os.getpid(),
+        'running': _describe(current) if current else None,
+        'finished': [_describe(session) for session in _finished],
+    }
+
+
+def _signal_watcher(requested):
+    while True:
+        requested.wait()
+        requested.clear()
+        try:
+            start_profile(os.getenv('PROFILE_SIGNAL_MODE', 'cpu'), float(os.getenv('PROFILE_SIGNAL_SECONDS', '30')))
+        except Exception as e:
+            print(f"Error starting profile from signal: {str(e)}")
+
+
+def install_signal_handler():
+    """Start a profile session on SIGUSR2; must be called from the main thread
+
+    The handler only sets an event. Starting the session takes _session_lock
+    and prints, which could deadlock or hit a reentrant write if done in
+    signal context on a thread that is itself inside a @stage or a print, so
+    a watcher thread does it.
+    """
+    if not hasattr(signal, 'SIGUSR2'):
+        return False
+
+    requested = threading.Event()
+
+    def handle(signum, frame):
+        requested.set()
+
+    try:
+        signal.signal(signal.SIGUSR2, handle)
+    except ValueError:
+        # Not in the main thread (e.g. imported by a tool); skip the signal hook
+        return False
+
+    def start_watcher():
+        threading.Thread(target=_signal_watcher, args=(requested,), daemon=True, name='profile-signal').start()
+
+    start_watcher()
+    # Threads do not survive fork (e.g. gunicorn --preload), so restart it in workers
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=start_watcher)
+    return True
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from cryptography.fernet import Fernet
+
+import processor
+import storage_client
+import key_layout
+import decrypt_executor
+
+# Re-encrypt every stored certificate under a fresh key.
+#
+# Keys are stored per password (derived from the DOB), so rotation works one
+# password at a time without breaking verification mid-run:
+#
+#   1. the key object is rewritten as "new\nold"; verify_certificate accepts
+#      tokens under either key while the rotation is in progress
+#   2. each certificate is downloaded, re-encrypted under the new key and
+#      uploaded to the current key layout, with its record and first-page
+#      preview updated
+#   3. once every certificate of that password is done, the key object is
+#      rewritten with only the new key
+#
+# A key object that already holds two keys is an unfinished rotation and is
+# resumed with the same new key. Finished certificates are appended to a
+# checkpoint file together with the fingerprint of the key they were
+# re-encrypted under; on restart an entry only counts if that fingerprint
+# matches the new key of the rotation being resumed, so entries from an
+# earlier, finished rotation never make a new one skip work. The checkpoint
+# is removed once every key has been finished. At most 2 x workers
+# certificates are held in memory at once.
+#
+#   python reencrypt.py --workers 16 --checkpoint reencrypt.ckpt --metrics-file reencrypt.json
+
+
+def list_stored_serials():
+    """Serials of all stored certificate PDFs, in either key layout"""
+    bucket = storage_client.get_bucket()
+    serials = set()
+
+    for blob in bucket.list_blobs(prefix=key_layout.kind_prefix('pdf')):
+        if blob.name.endswith('.pdf'):
+            serials.add(blob.name.rsplit('/', 1)[1][:-len('.pdf')])
+
+    for blob in bucket.list_blobs():
+        parsed = key_layout.parse_legacy_key(blob.name)
+        if parsed and parsed[0] == 'pdf':
+            serials.add(parsed[1])
+
+    return sorted(serials)
+
+
+def begin_key_rotation(password):
+    """Put the key object for a password into the 'new\\nold' state; returns the key data"""
+    current = processor.download_object('key', password)
+    if current is None:
+        return None
+
+    keys = [line.strip() for line in current.splitlines() if line.strip()]
+    if len(keys) > 1:
+        # Rotation already in progress from an earlier run
+        return current
+
+    rotating = Fernet.generate_key() + b'\n' + keys[0]
+    storage_client.upload(key_layout.object_key('key', password), rotating, content_type='application/octet-stream')
+    return rotating
+
+
+def key_fingerprint(rotating):
+    """Short fingerprint of the new (first) key in a key object"""
+    return hashlib.sha256(rotating.splitlines()[0].strip()).hexdigest()[:16]
+
+
+def finish_key_rotation(password, rotating):
+    """Drop the old key once every certificate under it has been re-encrypted"""
+    new_key = rotating.splitlines()[0].strip()
+    storage_client.upload(key_layout.object_key('key', password), new_key, content_type='application/octet-stream')
+
+
+def reencrypt_certificate(serial_number, rotating, dry_run):
+    """Re-encrypt one certificate under the primary key; returns (bytes_in, bytes_out)"""
+    token = processor.download_object('pdf', serial_number)
+    if token is None:
+        raise LookupError(f"{serial_number}.pdf not found")
+
+    # MultiFernet.rotate decrypts with any key and encrypts with the first
+    new_token = decrypt_executor.load_fernet(rotating).rotate(token)
+
+    # The first-page preview is encrypted under the same key
+    preview_token = processor.download_object('preview', serial_number)
+    new_preview_token = decrypt_executor.load_fernet(rotating).rotate(preview_token) if preview_token else None
+
+    if not dry_run:
+        storage_client.upload(key_layout.object_key('pdf', serial_number), new_token, content_type='application/pdf')
+        if new_preview_token:
+            storage_client.upload(key_layout.object_key('preview', serial_number), new_preview_token,
+                                  content_type='application/pdf')
+        processor.update_certificate_record(serial_number, encrypted_size=len(new_token))
+    return len(token), len(new_token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-encrypt all stored certificates under new keys")
+    parser.add_argument('--workers', type=int, default=16, help="Concurrent download/re-encrypt/upload jobs")
+    parser.add_argument('--checkpoint', default='reencrypt.ckpt', help="Checkpoint file for resuming")
+    parser.add_argument('--metrics-file', help="Write final metrics as JSON to this file")
+    parser.add_argument('--report-every', type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument('--dry-run', action='store_true', help="Decrypt and re-encrypt but upload nothing")
+    args = parser.parse_args()
+
+    if not processor.initialize_firebase():
+        raise RuntimeError("Firebase initialization failed")
+
+    dob_index = processor.load_dob_index()
+    if dob_index is None:
+        raise RuntimeError("Could not load certificates.csv")
+
+    # (serial, fingerprint of the key it was re-encrypted under)
+    done = set()
+    if os.path.exists(args.checkpoint):
+        with open(args.checkpoint, 'r', encoding='utf-8') as file:
+            done = {tuple(line.split()) for line in file if len(line.split()) == 2}
+
+    serials = list_stored_serials()
+    metrics = defaultdict(float)
+    metrics['stored'] = len(serials)
+
+    # Group certificates by password, since that is what a key belongs to
+    groups = defaultdict(list)
+    for serial_number in serials:
+        dob = dob_index.get(serial_number)
+        password = processor.create_easy_password(dob) if dob else None
+        if not password:
+            print(f"WARNING: No DOB for {serial_number}, leaving it unchanged")
+            metrics['no_dob'] += 1
+            continue
+        groups[password].append(serial_number)
+
+    # Checkpoint entries are matched per key once its rotation is known, so
+    # this is an upper bound until then
+    todo = sum(len(group) for group in groups.values())
+    print(f"{len(serials)} stored certificates, up to {todo} to re-encrypt under {len(groups)} keys")
+
+    checkpoint = None if args.dry_run else open(args.checkpoint, 'a', encoding='utf-8')
+    failed_passwords = set()
+    rotating_keys = {}
+    started = time.time()
+    last_report = started
+
+    def report(final=False):
+        elapsed = time.time() - started
+        rate = metrics['reencrypted'] / elapsed if elapsed else 0
+        mb_rate = metrics['bytes_in'] / elapsed / 1e6 if elapsed else 0
+        remaining = todo - metrics['reencrypted'] - metrics['failed']
+        eta = remaining / rate if rate else 0
+        label = "done" if final else "progress"
+        print(f"[{label}] {int(metrics['reencrypted'])}/{todo} re-encrypted, {int(metrics['failed'])} failed, "
+              f"{rate:.1f} certs/s, {mb_rate:.2f} MB/s, ETA {eta:.0f}s")
+
+    def collect(finished, pending):
+        for future in finished:
+            serial_number, password, fingerprint = pending.pop(future)
+            try:
+                bytes_in, bytes_out = future.result()
+            except Exception as e:
+                print(f"Failed to re-encrypt {serial_number}: {str(e)}")
+                metrics['failed'] += 1
+                failed_passwords.add(password)
+                continue
+            metrics['reencrypted'] += 1
+            metrics['bytes_in'] += bytes_in
+            metrics['bytes_out'] += bytes_out
+            if checkpoint:
+                checkpoint.write(f"{serial_number} {fingerprint}\n")
+                checkpoint.flush()
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix='reencrypt') as executor:
+            pending = {}
+            for password, group in groups.items():
+                if done and not args.dry_run:
+                    # An interrupted run may have finished this key already
+                    current = processor.download_object('key', password)
+                    if current and len(current.splitlines()) == 1 and \
+                            all((serial_number, key_fingerprint(current)) in done for serial_number in group):
+                        metrics['skipped'] += len(group)
+                        todo -= len(group)
+                        continue
+
+                rotating = begin_key_rotation(password) if not args.dry_run else processor.download_object('key', password)
+                if rotating is None:
+                    print(f"WARNING: No key found for {len(group)} certificates, skipping")
+                    metrics['failed'] += len(group)
+                    failed_passwords.add(password)
+                    continue
+                if args.dry_run:
+                    rotating = Fernet.generate_key() + b'\n' + rotating
+                rotating_keys[password] = rotating
+
+                fingerprint = key_fingerprint(rotating)
+                for serial_number in group:
+                    if (serial_number, fingerprint) in done:
+                        metrics['skipped'] += 1
+                        todo -= 1
+                        continue
+                    future = executor.submit(reencrypt_certificate, serial_number, rotating, args.dry_run)
+                    pending[future] = (serial_number, password, fingerprint)
+                    if len(pending) >= args.workers * 2:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(finished, pending)
+                    if time.time() - last_report >= args.report_every:
+                        report()
+                        last_report = time.time()
+
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished, pending)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+
+    # Only drop old keys where every certificate made it across, including
+    # keys whose certificates were all finished by an earlier run
+    if not args.dry_run:
+        for password, rotating in rotating_keys.items():
+            if password in failed_passwords:
+                continue
+            finish_key_rotation(password, rotating)
+            metrics['keys_rotated'] += 1
+
+        # Every rotation is complete, so the checkpoint must not leak into the next one
+        if not failed_passwords and os.path.exists(args.checkpoint):
+            os.remove(args.checkpoint)
+
+    report(final=True)
+    metrics['elapsed_seconds'] = round(time.time() - started, 3)
+    metrics['keys_pending'] = len(failed_passwords)
+    if args.metrics_file:
+        with open(args.metrics_file, 'w', encoding='utf-8') as file:
+            json.dump(metrics, file, indent=2)
+
+    if failed_passwords:
+        print(f"{len(failed_passwords)} keys still hold the old key as well - rerun to finish them")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        traceback.print_exc()
+        sys.exit(1)
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import threading
+import traceback
+from datetime import datetime, timezone
+import storage_client
+
+# Append-only revocation log. Every revocation is its own immutable object
+# under REVOCATION_PREFIX, named so that lexicographic order is chronological:
+#
+#   revocations/{epoch_ms:015d}_{serial}.json
+#
+# Workers keep the revoked serials in an in-memory dict and pick up new
+# entries incrementally in a background thread, so is_revoked() is a plain
+# dictionary lookup on the request path and never touches storage.
+#
+# Serial and time are parsed from the object names, so a load costs one
+# listing however long the log is. The rest of an entry (reason, revoked_by)
+# is only downloaded when get_revocation() first needs it.
+#
+# Until the first full load has succeeded a worker fails closed: is_revoked()
+# answers True for every serial and callers check is_loaded() to report the
+# service as unavailable instead. The reloader retries every
+# REVOCATION_RETRY_SECONDS (default 5) until that first load succeeds.
+
+REVOCATION_PREFIX = "revocations/"
+
+_revoked = {}
+_entry_names = {}
+_seen_entries = set()
+_last_entry_ms = 0
+_loaded = False
+_state_lock = threading.Lock()
+_reload_thread = None
+
+
+def _entry_name(serial_number, revoked_ms):
+    return f"{REVOCATION_PREFIX}{revoked_ms:015d}_{serial_number}.json"
+
+
+def _entry_time_ms(name):
+    try:
+        return int(name[len(REVOCATION_PREFIX):].split('_', 1)[0])
+    except ValueError:
+        return 0
+
+
+def _parse_entry_name(name):
+    """Return (revoked_ms, serial) from an entry name, or None if it is not one"""
+    stem = name[len(REVOCATION_PREFIX):]
+    if not stem.endswith('.json') or '_' not in stem:
+        return None
+    revoked_ms, serial_number = stem[:-len('.json')].split('_', 1)
+    if not revoked_ms.isdigit() or not serial_number:
+        return None
+    return int(revoked_ms), serial_number
+
+
+def reload_revocations():
+    """Load revocation entries written since the last reload; returns count added, None on failure"""
+    global _last_entry_ms, _loaded
+
+    try:
+        if not storage_client.is_ready():
+            print("ERROR: Firebase not initialized")
+            return None
+
+        # Re-list a short overlap so entries uploaded late by other workers are not missed
+        overlap_ms = int(float(os.getenv('REVOCATION_RELOAD_OVERLAP', '300')) * 1000)
+        start_ms = max(0, _last_entry_ms - overlap_ms)
+        start_offset = f"{REVOCATION_PREFIX}{start_ms:015d}" if start_ms else None
+
+        added = 0
+        for name in storage_client.list_names(prefix=REVOCATION_PREFIX, start_offset=start_offset):
+            if name in _seen_entries:
+                continue
+            parsed = _parse_entry_name(name)
+            if parsed is None:
+                continue
+
+            revoked_ms, serial_number = parsed
+            revoked_at = datetime.fromtimestamp(revoked_ms / 1000, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+            with _state_lock:
+                _revoked[serial_number] = {'serial': serial_number, 'revoked_at': revoked_at}
+                _entry_names[serial_number] = name
+                _seen_entries.add(name)
+                _last_entry_ms = max(_last_entry_ms, revoked_ms)
+            added += 1
+
+        _loaded = True
+        if added:
+            print(f"Loaded {added} revocation entries ({len(_revoked)} revoked serials)")
+        return added
+
+    except Exception as e:
+        print(f"Error reloading revocations: {str(e)}")
+        traceback.print_exc()
+        return None
+
+
+def _reload_loop(interval):
+    retry = float(os.getenv('REVOCATION_RETRY_SECONDS', '5'))
+    while True:
+        time.sleep(interval if _loaded else min(interval, retry))
+        reload_revocations()
+
+
+def start_revocation_reloader():
+    """Do the initial load and start the background incremental reload"""
+    global _reload_thread
+
+    reload_revocations()
+    if _reload_thread is None:
+        interval = float(os.getenv('REVOCATION_RELOAD_SECONDS', '30'))
+        _reload_thread = threading.Thread(target=_reload_loop, args=(interval,), daemon=True, name='revocation-reload')
+        _reload_thread.start()
+        print(f"Revocation reloader started (every {interval:g}s)")
+
+
+def is_loaded():
+    """True once the revocation log has been loaded in full at least once"""
+    return _loaded
+
+
+def is_revoked(serial_number):
+    """Constant-time check against the in-memory revocation set; True until loaded"""
+    return not _loaded or serial_number in _revoked
+
+
+def get_revocation(serial_number):
+    """Return the revocation entry for a serial, or None (check is_loaded() first)
+
+    An entry known only from the listing has its body downloaded on first
+    use; if that fails the serial and time are returned without a reason.
+    """
+    entry = _revoked.get(serial_number)
+    if entry is None or 'reason' in entry:
+        return entry
+
+    name = _entry_names.get(serial_number)
+    try:
+        data = storage_client.download(name) if name else None
+    except Exception as e:
+        print(f"Error loading revocation entry {name}: {str(e)}")
+        return entry
+    if not data:
+        return entry
+
+    full = json.loads(data)
+    with _state_lock:
+        # A newer entry may have replaced this one meanwhile
+        if _entry_names.get(serial_number) == name:
+            _revoked[serial_number] = full
+    return full
+
+
+def revoke_certificate(serial_number, reason=None, revoked_by=None):
+    """Append a revocation entry to the log and apply it locally; returns the entry or None"""
+    global _last_entry_ms
+
+    try:
+        if not storage_client.is_ready():
+            print("ERROR: Firebase not initialized")
+            return None
+
+        now = datetime.now(timezone.utc)
+        revoked_ms = int(now.timestamp() * 1000)
+        entry = {
+            'serial': serial_number,
+            'reason': reason or '',
+            'revoked_by': revoked_by or '',
+            'revoked_at': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+
+        name = _entry_name(serial_number, revoked_ms)
+        # Never overwrite an existing entry: the log is append-only. Names are
+        # unique per serial and millisecond, so an existing object means a
+        # retried attempt of this write already landed.
+        if not storage_client.upload_if_absent(name, json.dumps(entry, separators=(',', ':')),
+                                               content_type='application/json'):
+            print(f"Revocation entry {name} already written")
+
+        with _state_lock:
+            _revoked[serial_number] = entry
+            _entry_names[serial_number] = name
+            _seen_entries.add(name)
+            _last_entry_ms = max(_last_entry_ms, revoked_ms)
+
+        print(f"Revoked certificate {serial_number}: {entry['reason']}")
+        return entry
+
+    except Exception as e:
+        print(f"Error revoking certificate: {str(e)}")
+        traceback.print_exc()
+        return None
+
+
+def get_revocation_stats():
+    return {
+        'loaded': _loaded,
+        'revoked_serials': len(_revoked),
+        'log_entries': len(_seen_entries),
+        'reloader_running': _reload_thread is not None,
+    }
@@ -1,10 +1,17 @@
-from flask import Flask, request, render_template, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import processor
+import decrypt_executor
+import revocation
+import storage_client
+import profiling
+import static_pages
 import os
 import tempfile
 import json
 import traceback
+import csv
+import hmac
 from PyPDF2 import PdfReader, PdfWriter
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -94,6 +101,24 @@ CORS(app)  # Enable CORS for all routes
 firebase_init_success = processor.initialize_firebase()
 if not firebase_init_success:
     print("ERROR: Firebase initialization failed - this will cause processing to fail")
+else:
+    revocation.start_revocation_reloader()
+
+if not os.getenv('CERT_RECORD_KEY'):
+    print("ERROR: CERT_RECORD_KEY not set - certificates cannot be issued and /verify/status will answer 503")
+
+# SIGUSR2 starts a profile session in this worker
+profiling.install_signal_handler()
+
+# Render, fingerprint and compress the static pages once per worker
+static_pages.precompile(app, ('verify.html', 'admin.html'))
+
+
+def is_admin_request():
+    """Check the X-Admin-Token header against ADMIN_TOKEN"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(admin_token) and hmac.compare_digest(admin_token, supplied)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -104,8 +129,12 @@ def home():
     <p>Endpoints:</p>
     <ul>
         <li>POST /process - Process and upload certificate</li>
-        <li>POST /verify - Verify certificate</li>
+        <li>POST /verify - Verify certificate ("preview": true for the first page only)</li>
         <li>GET /verify - Verification page</li>
+        <li>GET /verify/status?serial= - Certificate status</li>
+        <li>POST /verify/batch - Bulk verification (NDJSON, requires X-Admin-Token)</li>
+        <li>POST /admin/revoke - Revoke certificate (admin token)</li>
+        <li>POST /admin/profile - Start a profile session (admin token)</li>
     </ul>
     """.format("Connected" if firebase_init_success else "Failed to connect")
 
@@ -206,9 +235,9 @@ def process_certificate():
 
 @app.route('/verify', methods=['GET'])
 def verify_page():
-    """Serve verification page"""
+    """Serve verification page (precompiled, with ETag / 304 handling)"""
     try:
-        return render_template("verify.html")
+        return static_pages.serve("verify.html")
     except Exception as e:
         print(f"Error serving verify page: {str(e)}")
         return f"""
@@ -240,8 +269,10 @@ def verify_certificate():
         
         serial_number = data.get('serialNumber')
         dob = data.get('dob')
+        # First page only; the full document is fetched with a second request
+        preview = bool(data.get('preview'))
         
-        print(f"Verification request - Serial: {serial_number}, DOB: {dob}")
+        print(f"Verification request - Serial: {serial_number}, DOB: {dob}, Preview: {preview}")
         
         if not serial_number or not dob:
             return jsonify({
@@ -257,8 +288,31 @@ def verify_certificate():
                 'error': 'Date of birth must be in DD-MM-YYYY format'
             }), 400
         
+        # Fail closed until this worker has loaded the revocation list
+        if not revocation.is_loaded():
+            print("Revocation list not loaded - rejecting verification")
+            return jsonify({
+                'success': False,
+                'error': 'Verification service starting up, please retry shortly'
+            }), 503, {'Retry-After': '5'}
+        
+        if revocation.is_revoked(serial_number):
+            print(f"Certificate {serial_number} is revoked")
+            return jsonify({
+                'success': False,
+                'error': 'This certificate has been revoked'
+            }), 410
+        
+        # Shed load early instead of queueing behind a saturated decrypt pool
+        if decrypt_executor.is_saturated():
+            print("Decrypt executor saturated - rejecting verification")
+            return jsonify({
+                'success': False,
+                'error': 'Verification service busy, please retry shortly'
+            }), 503, {'Retry-After': '1'}
+        
         # Verify certificate
-        decrypted_pdf = processor.verify_certificate(serial_number, dob)
+        decrypted_pdf = processor.verify_certificate(serial_number, dob, preview=preview)
         
         if decrypted_pdf:
             print("Certificate verification successful!")
@@ -269,7 +323,9 @@ def verify_certificate():
             
             try:
                 # Return decrypted PDF
-                return send_file(temp_file_path, mimetype='application/pdf')
+                response = send_file(temp_file_path, mimetype='application/pdf')
+                response.headers['X-Certificate-Preview'] = 'first-page' if preview else 'full'
+                return response
             finally:
                 # Schedule cleanup of temporary file
                 try:
@@ -291,11 +347,124 @@ def verify_certificate():
             'error': f'Verification error: {str(e)}'
         }), 500
 
+@app.route('/verify/status', methods=['GET'])
+def verify_status():
+    """Lightweight status check that never touches the PDF blob"""
+    try:
+        serial_number = request.args.get('serial')
+        if not serial_number:
+            return jsonify({
+                'success': False,
+                'error': 'serial query parameter is required'
+            }), 400
+        
+        if not firebase_init_success:
+            return jsonify({
+                'success': False,
+                'error': 'Firebase connection failed - service unavailable'
+            }), 503
+        
+        result = processor.get_certificate_status(serial_number)
+        if result['status'] == 'unavailable':
+            # Fail closed rather than report validity that cannot be checked
+            return jsonify({
+                'success': False,
+                'error': result['error']
+            }), 503, {'Retry-After': '5'}
+        result['success'] = True
+        return jsonify(result), 200
+        
+    except Exception as e:
+        print(f"Error in /verify/status: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Status check error: {str(e)}'
+        }), 500
+
+@app.route('/verify/batch', methods=['POST'])
+def verify_batch():
+    """Check many certificates in one call and stream NDJSON results (requires X-Admin-Token)"""
+    try:
+        print("=== Starting batch verification ===")
+        
+        # Per-row answers would let anyone enumerate DOBs, which are the only secret
+        if not is_admin_request():
+            return jsonify({
+                'success': False,
+                'error': 'Admin token required'
+            }), 403
+        
+        if not firebase_init_success:
+            print("ERROR: Firebase not initialized - cannot verify certificates")
+            return jsonify({
+                'success': False,
+                'error': 'Firebase connection failed - service unavailable'
+            }), 503
+        
+        # Accept a JSON list or an uploaded CSV with serial_number,dob columns
+        if 'csvFile' in request.files:
+            mode = request.form.get('mode', 'integrity')
+            text = request.files['csvFile'].read().decode('utf-8-sig')
+            pairs = [
+                ((row.get('serial_number') or '').strip(), (row.get('dob') or '').strip())
+                for row in csv.DictReader(io.StringIO(text))
+            ]
+        else:
+            data = request.get_json(silent=True)
+            if not data or not isinstance(data.get('certificates'), list):
+                return jsonify({
+                    'success': False,
+                    'error': 'Provide a certificates list or a csvFile upload'
+                }), 400
+            if not all(isinstance(item, dict) for item in data['certificates']):
+                return jsonify({
+                    'success': False,
+                    'error': 'Each certificate must be an object with serialNumber and dob'
+                }), 400
+            mode = data.get('mode', 'integrity')
+            pairs = [(item.get('serialNumber'), item.get('dob')) for item in data['certificates']]
+        
+        if mode not in ('exists', 'integrity', 'decrypt'):
+            return jsonify({
+                'success': False,
+                'error': 'mode must be exists, integrity or decrypt'
+            }), 400
+        
+        max_rows = int(os.getenv('BATCH_VERIFY_MAX_ROWS', '50000'))
+        if len(pairs) > max_rows:
+            return jsonify({
+                'success': False,
+                'error': f'Batch too large (max {max_rows} rows)'
+            }), 413
+        
+        if not revocation.is_loaded():
+            return jsonify({
+                'success': False,
+                'error': 'Verification service starting up, please retry shortly'
+            }), 503, {'Retry-After': '5'}
+        
+        print(f"Batch verification: {len(pairs)} rows, mode {mode}")
+        
+        def generate():
+            for result in processor.verify_certificates_batch(pairs, mode=mode):
+                yield json.dumps(result) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+    except Exception as e:
+        print(f"Error in /verify/batch: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Batch verification error: {str(e)}'
+        }), 500
+
 @app.route('/admin', methods=['GET'])
 def admin_page():
-    """Serve admin page"""
+    """Serve admin page (precompiled, with ETag / 304 handling)"""
     try:
-        return render_template("admin.html")
+        return static_pages.serve("admin.html")
     except Exception as e:
         print(f"Error serving admin page: {str(e)}")
         return f"""
@@ -303,12 +472,117 @@ def admin_page():
         <p>Error loading admin page: {str(e)}</p>
         """, 500
 
+@app.route('/admin/revoke', methods=['POST'])
+def revoke_certificate():
+    """Append a certificate to the revocation log (requires X-Admin-Token)"""
+    try:
+        if not is_admin_request():
+            return jsonify({
+                'success': False,
+                'error': 'Admin token required'
+            }), 403
+        
+        if not firebase_init_success:
+            return jsonify({
+                'success': False,
+                'error': 'Firebase connection failed - service unavailable'
+            }), 503
+        
+        data = request.get_json(silent=True) or {}
+        serial_number = data.get('serialNumber')
+        if not serial_number:
+            return jsonify({
+                'success': False,
+                'error': 'Serial number is required'
+            }), 400
+        
+        entry = revocation.revoke_certificate(serial_number, data.get('reason'), request.remote_addr)
+        if not entry:
+            return jsonify({
+                'success': False,
+                'error': 'Could not write revocation entry - check server logs for details'
+            }), 500
+        
+        # The revocation log is authoritative; the record is updated for status readers
+        if not processor.update_certificate_record(serial_number, status='revoked'):
+            print(f"WARNING: Could not mark certificate record {serial_number} as revoked")
+        
+        return jsonify({
+            'success': True,
+            'message': f'Certificate {serial_number} revoked',
+            'revocation': entry
+        }), 200
+        
+    except Exception as e:
+        print(f"Error in /admin/revoke: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Revocation error: {str(e)}'
+        }), 500
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def profile_worker():
+    """Start a profile session in this worker (POST) or report its status (GET)"""
+    try:
+        if not is_admin_request():
+            return jsonify({
+                'success': False,
+                'error': 'Admin token required'
+            }), 403
+        
+        if request.method == 'GET':
+            return jsonify({'success': True, **profiling.get_profile_status()}), 200
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            session = profiling.start_profile(
+                mode=data.get('mode', 'cpu'),
+                duration=data.get('duration', 30),
+                interval_ms=data.get('interval_ms', 5)
+            )
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        if not session:
+            return jsonify({
+                'success': False,
+                'error': 'A profile session is already running in this worker'
+            }), 409
+        
+        return jsonify({
+            'success': True,
+            'message': 'Profile session started',
+            'session': session
+        }), 202
+        
+    except Exception as e:
+        print(f"Error in /admin/profile: {str(e)}")
+        traceback.print_exc()
+        return jsonify({
+            'success': False,
+            'error': f'Profiling error: {str(e)}'
+        }), 500
+
+@app.route('/admin/profile/<path:filename>', methods=['GET'])
+def download_profile(filename):
+    """Download a profile output file (requires X-Admin-Token)"""
+    if not is_admin_request():
+        return jsonify({
+            'success': False,
+            'error': 'Admin token required'
+        }), 403
+    return send_from_directory(profiling.profile_dir(), filename, as_attachment=True)
+
 @app.route('/debug', methods=['GET'])
 def debug_info():
     """Debug endpoint to check system status"""
     try:
         script_dir = os.path.dirname(__file__)
-        csv_path = os.path.join(script_dir, "certificates.csv")
+        csv_path = os.getenv("CERTIFICATES_CSV") or os.path.join(script_dir, "certificates.csv")
         
         debug_info = {
             'firebase_initialized': firebase_init_success,
@@ -316,11 +590,16 @@ def debug_info():
             'firebase_key_exists': os.path.exists('firebase_key.json'),
             'environment_vars': {
                 'FIREBASE_KEY_PATH': os.getenv('FIREBASE_KEY_PATH'),
-                'PORT': os.getenv('PORT')
+                'PORT': os.getenv('PORT'),
+                'CERT_RECORD_KEY_SET': bool(os.getenv('CERT_RECORD_KEY'))
             },
             'current_directory': os.getcwd(),
             'files_in_directory': os.listdir('.'),
-            'csv_path': csv_path
+            'csv_path': csv_path,
+            'decrypt_executor': decrypt_executor.get_metrics(),
+            'revocation': revocation.get_revocation_stats(),
+            'storage': storage_client.get_storage_metrics(),
+            'pages': static_pages.get_page_stats()
         }
         
         return jsonify(debug_info), 200
@@ -355,12 +634,16 @@ if __name__ == '__main__':
     print("API Endpoints:")
     print("  POST /process - Process certificates")
     print("  POST /verify - Verify certificates")
+    print("  GET /verify/status - Certificate status")
+    print("  POST /verify/batch - Bulk verification (NDJSON, requires X-Admin-Token)")
+    print("  POST /admin/revoke - Revoke certificates")
+    print("  POST /admin/profile - Profile this worker")
     print("  GET /debug - Debug information")
     print("="*50)
     
     # Check required files
     script_dir = os.path.dirname(__file__)
-    csv_path = os.path.join(script_dir, "certificates.csv")
+    csv_path = os.getenv("CERTIFICATES_CSV") or os.path.join(script_dir, "certificates.csv")
     
     required_files = [csv_path, 'firebase_key.json']
     for file in required_files:
@@ -0,0 +1,151 @@
+import os
+import gzip
+import hashlib
+import threading
+import traceback
+from flask import request, render_template, Response
+
+try:
+    import brotli
+except ImportError:
+    # Listed in requirements.txt; without it pages are offered as gzip and identity only
+    brotli = None
+
+# Precompiled delivery for pages whose templates take no context (verify,
+# admin). Each page is rendered once, fingerprinted with a content hash and
+# pre-compressed, so a GET only picks a variant by Accept-Encoding:
+#
+#   ETag            strong, "{fingerprint}" plus "-gz"/"-br" per encoding
+#   Cache-Control   public, max-age=PAGE_CACHE_MAX_AGE, stale-while-revalidate
+#   Vary            Accept-Encoding
+#
+# If-None-Match matching any variant of the current fingerprint gets a 304.
+# Page URLs carry a ?serial= query and are not fingerprinted themselves, so
+# max-age bounds how long returning visitors keep a page after a deploy;
+# after that the ETag makes revalidation a bodiless 304.
+#
+# Configuration (environment variables, read at precompile time):
+#   PAGE_CACHE_MAX_AGE      seconds browsers may reuse a page (default 86400)
+#   PAGE_CACHE_STALE        seconds a stale page may be shown while it is
+#                           revalidated in the background (default 604800)
+
+_pages = {}
+_pages_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'served': 0,
+    'not_modified': 0,
+    'bytes_sent': 0,
+}
+
+ENCODINGS = ('br', 'gzip', 'identity')
+
+
+def _compile(name):
+    body = render_template(name).encode('utf-8')
+    fingerprint = hashlib.sha256(body).hexdigest()[:16]
+
+    variants = {'identity': body}
+    # mtime=0 keeps the gzip output identical across restarts and workers
+    variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, mode=brotli.MODE_TEXT, quality=11)
+
+    max_age = int(os.getenv('PAGE_CACHE_MAX_AGE', '86400'))
+    stale = int(os.getenv('PAGE_CACHE_STALE', '604800'))
+    return {
+        'fingerprint': fingerprint,
+        'variants': variants,
+        'etags': {
+            'identity': fingerprint,
+            'gzip': f"{fingerprint}-gz",
+            'br': f"{fingerprint}-br",
+        },
+        'cache_control': f"public, max-age={max_age}, stale-while-revalidate={stale}",
+    }
+
+
+def precompile(app, names):
+    """Render and compress pages at startup; returns the names that compiled"""
+    compiled = []
+    with app.app_context():
+        for name in names:
+            try:
+                page = _compile(name)
+            except Exception as e:
+                # The route compiles it on first request and reports the error there
+                print(f"Error precompiling {name}: {str(e)}")
+                traceback.print_exc()
+                continue
+            with _pages_lock:
+                _pages[name] = page
+            sizes = ', '.join(f"{encoding} {len(data)}" for encoding, data in page['variants'].items())
+            print(f"Precompiled {name} ({page['fingerprint']}): {sizes} bytes")
+            compiled.append(name)
+    return compiled
+
+
+def _get_page(name):
+    page = _pages.get(name)
+    if page is None:
+        with _pages_lock:
+            page = _pages.get(name)
+            if page is None:
+                page = _pages[name] = _compile(name)
+    return page
+
+
+def _choose_encoding(page):
+    """Best variant the client accepts, preferring the smallest on equal quality"""
+    accepted = request.accept_encodings
+    best, best_quality = 'identity', 0.0
+    for encoding in ENCODINGS:
+        if encoding not in page['variants']:
+            continue
+        quality = accepted[encoding] if encoding != 'identity' else 1.0
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def serve(name):
+    """Response for a precompiled page, or a 304 if the client's copy is current"""
+    page = _get_page(name)
+    encoding = _choose_encoding(page)
+
+    headers = {
+        'Cache-Control': page['cache_control'],
+        'Vary': 'Accept-Encoding',
+    }
+
+    if any(request.if_none_match.contains_weak(etag) for etag in page['etags'].values()):
+        with _metrics_lock:
+            _metrics['not_modified'] += 1
+        response = Response(status=304, headers=headers)
+    else:
+        body = page['variants'][encoding]
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        with _metrics_lock:
+            _metrics['served'] += 1
+            _metrics['bytes_sent'] += len(body)
+        response = Response(body, mimetype='text/html', headers=headers)
+
+    response.set_etag(page['etags'][encoding])
+    return response
+
+
+def get_page_stats():
+    """Fingerprints, variant sizes and serve counters for /debug"""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats['brotli'] = brotli is not None
+    stats['pages'] = {
+        name: {
+            'fingerprint': page['fingerprint'],
+            'sizes': {encoding: len(data) for encoding, data in page['variants'].items()},
+        }
+        for name, page in list(_pages.items())
+    }
+    return stats
@@ -0,0 +1,417 @@
+import os
+import time
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import firebase_admin
+from firebase_admin import storage
+from google.api_core.exceptions import NotFound, PreconditionFailed
+
+# Resilient access to the certificate bucket. Every call gets a deadline;
+# idempotent calls are retried with jittered exponential backoff; reads are
+# hedged with a second request once they run longer than the recent p95; and
+# a circuit breaker fails fast (serving reads from a small cache) while the
+# bucket keeps failing.
+#
+# Configuration (environment variables):
+#   STORAGE_TIMEOUT             overall deadline per call in seconds (default 10)
+#   STORAGE_RETRIES             extra attempts for idempotent calls (default 3)
+#   STORAGE_HEDGE               '0' disables hedged reads (default on)
+#   STORAGE_HEDGE_MIN_DELAY     lower bound for the hedge delay in seconds (default 0.05)
+#   STORAGE_HEDGE_WORKERS       threads for hedged reads (default 32)
+#   STORAGE_BREAKER_THRESHOLD   consecutive failures that open the breaker (default 5)
+#   STORAGE_BREAKER_COOLDOWN    seconds before a trial call is let through (default 30)
+#   STORAGE_CACHE_MAX_BYTES     size of the read cache (default 64 MiB, 0 disables)
+
+HEDGE_INITIAL_DELAY = 0.5
+LATENCY_SAMPLES = 200
+
+
+class StorageUnavailable(Exception):
+    """Raised when the bucket cannot be reached within the deadline or the breaker is open"""
+
+
+_bucket = None
+_hedge_pool = None
+_hedge_slots = None
+_hedge_pool_lock = threading.Lock()
+
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+
+_breaker_lock = threading.Lock()
+_breaker = {'state': 'closed', 'failures': 0, 'opened_at': 0.0, 'trial_in_flight': False}
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_bytes = 0
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'calls': 0,
+    'failures': 0,
+    'retries': 0,
+    'hedges': 0,
+    'hedge_wins': 0,
+    'hedge_pool_full': 0,
+    'short_circuited': 0,
+    'cache_hits': 0,
+}
+
+
+def _config(name, default):
+    return float(os.getenv(name, default))
+
+
+def _count(name, amount=1):
+    with _metrics_lock:
+        _metrics[name] += amount
+
+
+def set_bucket(bucket):
+    """Use a specific bucket object (e.g. FakeBucket) instead of the Firebase default"""
+    global _bucket
+    _bucket = bucket
+
+
+def is_ready():
+    """True when a bucket is available, either injected or via Firebase"""
+    return _bucket is not None or bool(firebase_admin._apps)
+
+
+def get_bucket():
+    return _bucket if _bucket is not None else storage.bucket()
+
+
+# Circuit breaker
+
+def _breaker_allows():
+    with _breaker_lock:
+        if _breaker['state'] == 'closed':
+            return True
+        if _breaker['state'] == 'open':
+            if time.monotonic() - _breaker['opened_at'] < _config('STORAGE_BREAKER_COOLDOWN', '30'):
+                return False
+            _breaker['state'] = 'half_open'
+            _breaker['trial_in_flight'] = False
+        # Half open: let a single trial call through
+        if _breaker['trial_in_flight']:
+            return False
+        _breaker['trial_in_flight'] = True
+        return True
+
+
+def _breaker_success():
+    with _breaker_lock:
+        if _breaker['state'] != 'closed':
+            print("Storage circuit breaker closed")
+        _breaker.update(state='closed', failures=0, trial_in_flight=False)
+
+
+def _breaker_failure():
+    with _breaker_lock:
+        _breaker['failures'] += 1
+        _breaker['trial_in_flight'] = False
+        threshold = _config('STORAGE_BREAKER_THRESHOLD', '5')
+        if _breaker['state'] == 'half_open' or _breaker['failures'] >= threshold:
+            if _breaker['state'] != 'open':
+                print(f"Storage circuit breaker opened after {_breaker['failures']} failures")
+            _breaker.update(state='open', opened_at=time.monotonic())
+
+
+# Read cache, used while the breaker is open
+
+def _cache_put(name, data):
+    global _cache_bytes
+    max_bytes = _config('STORAGE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))
+    if len(data) > max_bytes:
+        return
+    with _cache_lock:
+        old = _cache.pop(name, None)
+        if old is not None:
+            _cache_bytes -= len(old)
+        _cache[name] = data
+        _cache_bytes += len(data)
+        while _cache_bytes > max_bytes:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def _cache_get(name):
+    with _cache_lock:
+        data = _cache.get(name)
+        if data is not None:
+            _cache.move_to_end(name)
+        return data
+
+
+def _cache_drop(name):
+    global _cache_bytes
+    with _cache_lock:
+        old = _cache.pop(name, None)
+        if old is not None:
+            _cache_bytes -= len(old)
+
+
+# Call machinery
+
+def _hedge_delay():
+    """Recent p95 read latency, or a fixed delay until enough samples exist"""
+    samples = sorted(_latencies)
+    if len(samples) < 20:
+        return HEDGE_INITIAL_DELAY
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return max(_config('STORAGE_HEDGE_MIN_DELAY', '0.05'), p95)
+
+
+def _submit(fn, deadline):
+    """Start fn on a free pool thread, or return None when every thread is busy
+
+    Work never queues behind the pool, and a task gets the time left until
+    the absolute deadline when it starts, not when it was submitted.
+    """
+    global _hedge_pool, _hedge_slots
+
+    if _hedge_pool is None:
+        with _hedge_pool_lock:
+            if _hedge_pool is None:
+                workers = int(_config('STORAGE_HEDGE_WORKERS', '32'))
+                _hedge_slots = threading.BoundedSemaphore(workers)
+                _hedge_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='storage')
+
+    if not _hedge_slots.acquire(blocking=False):
+        _count('hedge_pool_full')
+        return None
+
+    def run():
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Storage call deadline passed before it started")
+            return fn(remaining)
+        finally:
+            _hedge_slots.release()
+
+    return _hedge_pool.submit(run)
+
+
+def _hedged(fn, timeout):
+    """Run fn(timeout), starting a second copy if the first is slower than the hedge delay
+
+    Taking whichever copy finishes first needs the caller free to wait, so
+    the first attempt runs on the pool when a thread is free; otherwise it
+    runs unhedged in the caller's thread.
+    """
+    deadline = time.monotonic() + timeout
+    primary = _submit(fn, deadline)
+    if primary is None:
+        return fn(timeout)
+
+    done, _ = wait([primary], timeout=min(_hedge_delay(), timeout))
+    if done:
+        return primary.result()
+
+    hedge = _submit(fn, deadline)
+    if hedge is None:
+        done, _ = wait([primary], timeout=max(0.0, deadline - time.monotonic()))
+        if not done:
+            raise TimeoutError(f"Storage call exceeded {timeout}s")
+        return primary.result()
+
+    _count('hedges')
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            try:
+                result = future.result()
+            except NotFound:
+                raise
+            except Exception as e:
+                error = e
+                continue
+            if future is hedge:
+                _count('hedge_wins')
+            return result
+    raise error or TimeoutError(f"Storage call exceeded {timeout}s")
+
+
+def _call(op_name, fn, idempotent=True, hedge=False):
+    """Run fn(timeout) with deadline, retries, optional hedging and the circuit breaker"""
+    _count('calls')
+    if not _breaker_allows():
+        _count('short_circuited')
+        raise StorageUnavailable(f"Storage circuit open, skipping {op_name}")
+
+    timeout = _config('STORAGE_TIMEOUT', '10')
+    deadline = time.monotonic() + timeout
+    attempts = 1 + (int(_config('STORAGE_RETRIES', '3')) if idempotent else 0)
+    use_hedge = hedge and os.getenv('STORAGE_HEDGE', '1') != '0'
+    backoff = 0.1
+
+    for attempt in range(attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        started = time.monotonic()
+        try:
+            result = _hedged(fn, remaining) if use_hedge else fn(remaining)
+            if hedge:
+                _latencies.append(time.monotonic() - started)
+            _breaker_success()
+            return result
+        except (NotFound, PreconditionFailed):
+            # A definite answer from the bucket, not a failure
+            _breaker_success()
+            raise
+        except Exception as e:
+            _count('failures')
+            print(f"Storage {op_name} attempt {attempt + 1}/{attempts} failed: {str(e)}")
+            if attempt + 1 < attempts:
+                _count('retries')
+                # Full jitter backoff, never past the deadline
+                sleep_for = min(random.uniform(0, backoff), max(0.0, deadline - time.monotonic()))
+                time.sleep(sleep_for)
+                backoff *= 2
+
+    _breaker_failure()
+    raise StorageUnavailable(f"Storage {op_name} failed after {attempts} attempts")
+
+
+# Public operations
+
+def download(name):
+    """Download an object; returns bytes, or None if it does not exist"""
+    bucket = get_bucket()
+    try:
+        data = _call(f"download {name}",
+                     lambda timeout: bucket.blob(name).download_as_bytes(timeout=timeout),
+                     hedge=True)
+    except NotFound:
+        _cache_drop(name)
+        return None
+    except StorageUnavailable:
+        cached = _cache_get(name)
+        if cached is None:
+            raise
+        _count('cache_hits')
+        print(f"Serving {name} from storage cache")
+        return cached
+
+    _cache_put(name, data)
+    return data
+
+
+def exists(name):
+    """Check whether an object exists"""
+    bucket = get_bucket()
+    try:
+        return _call(f"exists {name}", lambda timeout: bucket.blob(name).exists(timeout=timeout), hedge=True)
+    except StorageUnavailable:
+        if _cache_get(name) is not None:
+            _count('cache_hits')
+            return True
+        raise
+
+
+def upload(name, data, content_type=None, idempotent=True):
+    """Upload an object; plain overwrites are idempotent and retried"""
+    bucket = get_bucket()
+
+    def do_upload(timeout):
+        blob = bucket.blob(name)
+        if content_type:
+            blob.upload_from_string(data, content_type=content_type, timeout=timeout)
+        else:
+            blob.upload_from_string(data, timeout=timeout)
+
+    _call(f"upload {name}", do_upload, idempotent=idempotent)
+    _cache_drop(name)
+    return True
+
+
+def upload_if_absent(name, data, content_type=None):
+    """Create an object only if it does not exist; returns False if it already did
+
+    Retried like a plain upload: if an earlier attempt landed, the retry
+    sees the object and returns False.
+    """
+    bucket = get_bucket()
+
+    def do_upload(timeout):
+        bucket.blob(name).upload_from_string(data, content_type=content_type, timeout=timeout,
+                                             if_generation_match=0)
+
+    try:
+        _call(f"upload {name}", do_upload)
+    except PreconditionFailed:
+        return False
+    _cache_drop(name)
+    return True
+
+
+def list_names(prefix=None, start_offset=None):
+    """Names of the objects under a prefix, in lexicographic order
+
+    The whole listing, including every page, runs under one deadline.
+    """
+    bucket = get_bucket()
+    return _call(f"list {prefix or ''}",
+                 lambda timeout: [blob.name for blob in bucket.list_blobs(prefix=prefix, start_offset=start_offset,
+                                                                          timeout=timeout)])
+
+
+def copy(source_name, destination_name, if_absent=False):
+    """Server-side copy within the bucket; safe to retry
+
+    With if_absent the destination is never overwritten and False is
+    returned when it already exists.
+    """
+    bucket = get_bucket()
+    preconditions = {'if_generation_match': 0} if if_absent else {}
+    try:
+        _call(f"copy {source_name}",
+              lambda timeout: bucket.copy_blob(bucket.blob(source_name), bucket, destination_name, timeout=timeout,
+                                               **preconditions))
+    except PreconditionFailed:
+        return False
+    _cache_drop(destination_name)
+    return True
+
+
+def delete(name):
+    """Delete an object; a missing object counts as deleted"""
+    bucket = get_bucket()
+    try:
+        _call(f"delete {name}", lambda timeout: bucket.blob(name).delete(timeout=timeout))
+    except NotFound:
+        pass
+    _cache_drop(name)
+    return True
+
+
+def get_storage_metrics():
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    with _breaker_lock:
+        snapshot['breaker_state'] = _breaker['state']
+        snapshot['breaker_failures'] = _breaker['failures']
+    with _cache_lock:
+        snapshot['cache_entries'] = len(_cache)
+        snapshot['cache_bytes'] = _cache_bytes
+    snapshot['hedge_delay_ms'] = round(_hedge_delay() * 1000, 1)
+    return snapshot
+
+
+def reset():
+    """Clear breaker, cache and latency history (used by tests and tooling)"""
+    global _cache_bytes
+    with _breaker_lock:
+        _breaker.update(state='closed', failures=0, opened_at=0.0, trial_in_flight=False)
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+    _latencies.clear()